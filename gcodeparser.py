@@ -0,0 +1,1268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+G-code parser of the G-code viewer
+
+Parses G-code files into SEGMENTS, columnar NumPy stores of the moves,
+without any GUI: the module only needs NumPy, so that batch tools and
+tests can use it without wxPython.
+
+iter_segments(source) streams the moves of a file name, file, stream or
+iterable of lines as batches of SEGMENTS; parse_gcode_file(name) parses
+a whole file, parse_files(names) several files in worker processes.
+Errors are raised as IOError, never shown. Files compressed with gzip,
+bzip2 or xz are decompressed while they are parsed, see open_gcode.
+read_lines(open_stream(source)) reads the lines of a live stream (standard
+input, a named pipe or a socket) as they come.
+
+Dependencies:
+NumPy (parsed moves are kept in typed arrays)
+lzma or backports.lzma, optional (xz compressed files)
+
+LinuxCNC G-Code Quick reference: http://linuxcnc.org/docs/html/gcode.html
+
+"""
+import numpy as np
+from math import *
+from array import array
+import os
+import sys
+import re
+import multiprocessing
+import select
+import socket
+import stat
+import time
+import copy
+import hashlib
+import json
+import tempfile
+import struct
+import zlib
+import bz2
+from cStringIO import StringIO
+try:
+	import lzma
+except ImportError:
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None # no xz files
+
+# (first, second) axis index of the G17/G18/G19 arc planes: XY, ZX, YZ
+_PLANE_AXES = ((0,1), (2,0), (1,2))
+
+# G-code tokenizer: a comment, or a letter followed by a number
+# (comments match with empty groups and are dropped by tokenize_gcode)
+_GCODE_WORD_RE = re.compile(r"\([^)]*\)?|;.*|([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+# the same comments and words within several lines, for scan_gcode_range
+_GCODE_LINE_COMMENT_RE = re.compile(r"\([^)\n]*\)?|;[^\n]*")
+_GCODE_WORD_RES = dict((word, re.compile(word + r"[^\S\n]*([-+]?(?:\d+\.?\d*|\.\d+))"))
+	for word in 'GXYZF')
+# files this large are parsed by parse_gcode_parallel
+_PARALLEL_BYTES = 32 * 1024 * 1024
+# toolpath files, see read_toolpath
+_TOOLPATH_MAGIC = 'PYGCVTP\0'
+_TOOLPATH_VERSION = 1
+_TOOLPATH_HEADER = '<8sIIQQ6d'
+_TOOLPATH_BLOCK = 65536 # moves per block of the block bounds
+# magic numbers of the compressed files, see open_gcode
+_COMPRESSIONS = (('\x1f\x8b', 'gzip'), ('BZh', 'bz2'), ('\xfd7zXZ\x00', 'xz'))
+_DECOMPRESS_BYTES = 1024 * 1024 # compressed bytes decoded at a time
+_DECOMPRESS_ERRORS = (zlib.error, IOError, EOFError, ValueError) + ((lzma.LZMAError,) if lzma else ())
+
+class POINT:
+	def __init__(self, x, y, z):
+		self.x = x
+		self.y = y
+		self.z = z
+
+class MODAL:
+	"""
+	Modal state of the G-code parser between two lines: position, feed
+	rate, motion mode (style), plane and the number and byte offset of
+	the next line.
+	
+	"""
+	def __init__(self, x=0.0, y=0.0, z=0.0, feed=0, style=0, plane=0, line=1, offset=0):
+		self.x = x
+		self.y = y
+		self.z = z
+		self.feed = feed
+		self.style = style
+		self.plane = plane # G17 (XY) is the power-up default
+		self.line = line
+		self.offset = offset
+
+	def update(self, scan):
+		"""Move past G-code pre-scanned by scan_gcode_range()."""
+		for attr, value in scan.items():
+			if (attr == 'lines'):
+				self.line += value
+			else:
+				setattr(self, attr, value)
+
+class LINE:
+	def __init__(self, style, line, speed, points):
+		self.style = style
+		self.line = line
+		self.speed = speed
+		self.points = points
+
+class ARC:
+	def __init__(self, style, line, speed, plane, p1, p2, center):
+		self.style = style
+		self.line = line
+		self.speed = speed
+		self.plane = plane
+		self.p1 = p1
+		self.p2 = p2
+		self.center = center
+
+class SEGMENTS:
+	"""
+	Columnar store of the moves parsed from one G-code file.
+	
+	One row per move, every column a contiguous NumPy array:
+	start, end - (N,3) float32 end points of the move
+	center - (N,3) float32 absolute arc center (zero for straight moves)
+	style - int8 G-code motion mode: 0 rapid, 1 feed, 2 cw arc, 3 ccw arc
+	plane - int8 arc plane: 0 XY, 1 ZX, 2 YZ
+	line - int32 source line number
+	speed - float32 feed rate
+	
+	That is 46 bytes per move. Rows are collected by append() into
+	compact array.array buffers and turned into the columns by close(),
+	which also extends bounds, the [minima, maxima] (2,3) array of the
+	end points (None while empty).
+	
+	The columns of a store read from a toolpath file are read only views
+	of the memory-mapped file, and blocks holds its block bounds (see
+	block_bounds), None otherwise.
+	
+	"""
+	# name, type and row width (0 for a single value) of the columns
+	_columns = (('start', np.float32, 3), ('end', np.float32, 3), ('center', np.float32, 3),
+		('style', np.int8, 0), ('plane', np.int8, 0), ('line', np.int32, 0), ('speed', np.float32, 0))
+
+	def __init__(self):
+		self.__init_buffers()
+		self.bounds = None
+		self.blocks = None
+		self._storage = {} # column name -> array with room for more rows
+		self._capacity = 0
+		for name, dtype, width in self._columns:
+			setattr(self, name, np.zeros((0,width) if width else 0, dtype))
+
+	def __len__(self):
+		return len(self.style)
+
+	@property
+	def nbytes(self):
+		"""Memory used by the columns."""
+		return sum(getattr(self, name).nbytes for name, dtype, width in self._columns)
+
+	def append(self, style, line, speed, plane, x1, y1, z1, x2, y2, z2, cx=0.0, cy=0.0, cz=0.0):
+		"""Add one move; it shows up in the columns after close()."""
+		self._coords.extend((x1, y1, z1, x2, y2, z2, cx, cy, cz))
+		self._style.append(style)
+		self._plane.append(plane)
+		self._line.append(line)
+		self._speed.append(speed)
+
+	def close(self):
+		"""Move the appended rows into the NumPy columns."""
+		if (len(self._style) == 0):
+			return
+		rows = np.frombuffer(self._coords, np.float32).reshape(-1, 9)
+		self.bounds = merge_bounds(self.bounds, points_bounds(rows[:,0:6].reshape(-1, 3)))
+		self._append_columns({
+			'start': rows[:,0:3],
+			'end': rows[:,3:6],
+			'center': rows[:,6:9],
+			'style': np.frombuffer(self._style, np.int8),
+			'plane': np.frombuffer(self._plane, np.int8),
+			'line': np.frombuffer(self._line, np.int32),
+			'speed': np.frombuffer(self._speed, np.float32)})
+		self.__init_buffers()
+
+	def extend(self, other):
+		"""
+		Append the rows of another, closed, store. An empty store takes
+		over the columns of the other one instead of copying them.
+		
+		"""
+		if (len(other) == 0):
+			return
+		self.bounds = merge_bounds(self.bounds, other.bounds)
+		if (len(self) == 0 and self._capacity == 0):
+			for name, dtype, width in self._columns:
+				setattr(self, name, getattr(other, name))
+			self.blocks = other.blocks
+			return
+		self.blocks = None
+		self._append_columns(dict((name, getattr(other, name)) for name, dtype, width in self._columns))
+
+	def view(self, start, stop):
+		"""SEGMENTS of the rows start to stop, sharing the columns (without bounds)."""
+		part = SEGMENTS()
+		for name, dtype, width in self._columns:
+			setattr(part, name, getattr(self, name)[start:stop])
+		return part
+
+	def trim(self):
+		"""Give back the room kept for more rows by extend()."""
+		if (self._capacity > len(self)):
+			for name, dtype, width in self._columns:
+				setattr(self, name, getattr(self, name).copy())
+		self._storage = {}
+		self._capacity = 0
+
+	def _append_columns(self, columns):
+		# grow the storage by doubling, so appending chunks stays linear
+		n = len(self)
+		m = len(columns['style'])
+		if (n + m > self._capacity):
+			self._capacity = max(n + m, 2 * self._capacity)
+			for name, dtype, width in self._columns:
+				col = np.empty((self._capacity, width) if width else self._capacity, dtype)
+				col[:n] = getattr(self, name)
+				self._storage[name] = col
+		for name, dtype, width in self._columns:
+			col = self._storage[name]
+			col[n:n+m] = columns[name]
+			setattr(self, name, col[:n+m])
+
+	def __init_buffers(self):
+		self._coords = array('f') # start xyz, end xyz, center xyz per row
+		self._style = array('b')
+		self._plane = array('b')
+		self._line = array('i')
+		self._speed = array('f')
+
+	def rotate_shift(self, angle, xshift, yshift):
+		"""
+		Rotate all points clockwise by angle (radians) around the origin,
+		then shift them, the same as rot_point() and shift_point().
+		
+		"""
+		c = cos(angle)
+		s = sin(angle)
+		for col in (self.start, self.end, self.center):
+			x = col[:,0].astype(np.float64)
+			y = col[:,1].astype(np.float64)
+			col[:,0] = x*c + y*s + xshift
+			col[:,1] = y*c - x*s + yshift
+		if (len(self) > 0):
+			self.bounds = merge_bounds(points_bounds(self.start), points_bounds(self.end))
+
+	def transformed(self, matrix):
+		"""
+		Copy of the store with its points moved by an affine transform,
+		the (3,4) array [A | t] mapping p to A p + t. The other columns
+		are shared.
+		
+		"""
+		other = self.view(0, len(self))
+		a = matrix[:,:3].T
+		t = matrix[:,3]
+		other.start = (np.dot(self.start, a) + t).astype(np.float32)
+		other.end = (np.dot(self.end, a) + t).astype(np.float32)
+		other.center = (np.dot(self.center, a) + t).astype(np.float32)
+		other.center[self.style < 2] = 0.0 # no center for straight moves
+		if (len(self) > 0):
+			other.bounds = merge_bounds(points_bounds(other.start), points_bounds(other.end))
+		return other
+
+class COMPRESSED_FILE:
+	"""
+	A gzip, bzip2 or xz compressed G-code file, read line by line.
+	
+	The lines are decoded while they are read: the compressed data is read
+	_DECOMPRESS_BYTES at a time and only the text of one such block is held
+	decoded, so that the whole text is never in memory. tell() is the
+	position in the compressed file. Files of several compressed streams
+	one after the other (e.g. concatenated gzip files) are read through.
+	
+	"""
+	def __init__(self, name, kind):
+		if (kind == 'xz' and lzma is None):
+			raise IOError("Reading xz compressed files needs the lzma module " + name)
+		self.name = name
+		self.kind = kind
+		self._file = open(name,'rb')
+
+	def decompressor(self):
+		if (self.kind == 'gzip'):
+			return zlib.decompressobj(16 + zlib.MAX_WBITS)
+		elif (self.kind == 'bz2'):
+			return bz2.BZ2Decompressor()
+		else:
+			return lzma.LZMADecompressor()
+
+	def __iter__(self):
+		magic = dict((kind, prefix) for prefix, kind in _COMPRESSIONS)[self.kind]
+		decompressor = self.decompressor()
+		rest = '' # start of a line cut by the end of a block
+		while True:
+			data = self._file.read(_DECOMPRESS_BYTES)
+			if not data:
+				break
+			while data:
+				try:
+					text = decompressor.decompress(data)
+				except EOFError:
+					# bz2 and lzma: the stream ended with the last block, the
+					# next one starts with the next stream, or with garbage
+					if not self.next_stream(data, magic):
+						break
+					decompressor = self.decompressor()
+					continue
+				except _DECOMPRESS_ERRORS:
+					raise IOError("Broken compressed file " + self.name)
+				data = decompressor.unused_data
+				if (data and not self.next_stream(data, magic)):
+					data = '' # trailing garbage, e.g. zero padding
+				elif data:
+					decompressor = self.decompressor()
+				if not text:
+					continue
+				lines = (rest + text).split('\n')
+				rest = lines.pop()
+				for line in lines:
+					yield line + '\n'
+		if not self.finished(decompressor):
+			raise IOError("Truncated compressed file " + self.name)
+		if rest:
+			yield rest
+
+	def next_stream(self, data, magic):
+		"""
+		True if data, read after the end of a stream, starts another one,
+		or the part of its magic bytes a block ended with.
+		
+		"""
+		return data.startswith(magic) or magic.startswith(data)
+
+	def finished(self, decompressor):
+		"""True if decompressor has read the end of its stream."""
+		unused = len(decompressor.unused_data)
+		try:
+			decompressor.decompress('\0')
+		except EOFError:
+			return True # bz2 and lzma
+		except _DECOMPRESS_ERRORS:
+			return False
+		return len(decompressor.unused_data) > unused # zlib
+
+	def tell(self):
+		return self._file.tell()
+
+	def close(self):
+		self._file.close()
+
+class PARSE_CACHE:
+	"""
+	On-disk cache of parsed G-code files.
+	
+	An entry is a toolpath file (see read_toolpath) of the SEGMENTS of one
+	file, memory-mapped when loaded. It is named after the file path, size
+	and modification time and the rotation/shift it was parsed with, and
+	also records a hash of the first and last megabyte of the file, checked
+	when loading, so that a file rewritten within the same second with
+	the same size is not mistaken for the cached one. Hashing samples
+	instead of the whole file keeps a hit down to a few milliseconds.
+	
+	Entries are evicted least recently used first (loading one touches
+	it) when the cache grows over its size.
+	
+	The location defaults to $PYGCODEVIEWER_CACHE or ~/.cache/pygcodeviewer
+	and the size to $PYGCODEVIEWER_CACHE_MB or 1024 MB.
+	
+	"""
+	_version = 3 # of the entry layout, part of the key
+	_sample = 1024 * 1024 # bytes hashed at each end of a file
+
+	def __init__(self, directory=None, max_bytes=None):
+		if directory is None:
+			directory = os.environ.get('PYGCODEVIEWER_CACHE',
+				os.path.join(os.path.expanduser('~'), '.cache', 'pygcodeviewer'))
+		if max_bytes is None:
+			max_bytes = int(os.environ.get('PYGCODEVIEWER_CACHE_MB', 1024)) * 1024 * 1024
+		self.directory = directory
+		self.max_bytes = max_bytes
+
+	def path(self, name, rot_ang, xshift, yshift):
+		"""Entry file of a G-code file, None if the file can't be read."""
+		try:
+			st = os.stat(name)
+		except OSError:
+			return None
+		key = repr((self._version, os.path.realpath(name), st.st_size, st.st_mtime,
+			float(rot_ang), float(xshift), float(yshift)))
+		return os.path.join(self.directory, hashlib.sha1(key).hexdigest() + '.gtp')
+
+	def content_hash(self, name):
+		"""Hash of the size and the first and last megabyte of a file."""
+		f = open(name,'rb')
+		try:
+			h = hashlib.sha1(str(os.fstat(f.fileno()).st_size))
+			h.update(f.read(self._sample))
+			f.seek(max(0, os.fstat(f.fileno()).st_size - self._sample))
+			h.update(f.read(self._sample))
+		finally:
+			f.close()
+		return h.hexdigest()
+
+	def load(self, name, rot_ang=0.0, xshift=0, yshift=0, modal=None):
+		"""
+		Get the SEGMENTS of a file, None if it isn't cached. modal, if
+		given, is set to the MODAL state at the end of the file.
+		
+		"""
+		path = self.path(name, rot_ang, xshift, yshift)
+		if (path is None or not os.path.exists(path)):
+			return None
+		try:
+			meta = {}
+			segments = read_toolpath(path, meta=meta)
+			if (meta['hash'] != self.content_hash(name)):
+				return None
+			if (modal is not None):
+				modal.__init__(**meta['modal'])
+			os.utime(path, None) # most recently used
+		except Exception:
+			# a broken or half written entry
+			self.remove(path)
+			return None
+		return segments
+
+	def store(self, name, rot_ang, xshift, yshift, segments, modal):
+		"""
+		Add the SEGMENTS of a file, then evict old entries. Nothing is
+		stored unless modal, the MODAL state after the parsing, is at the
+		end of the (uncompressed) file: the file was changed while it was
+		parsed.
+		
+		"""
+		path = self.path(name, rot_ang, xshift, yshift)
+		if (path is None or (modal.offset != file_size(name) and not compression(name))):
+			return
+		try:
+			if not os.path.isdir(self.directory):
+				os.makedirs(self.directory)
+			meta = {'name': os.path.realpath(name), 'hash': self.content_hash(name), 'modal': vars(modal)}
+			write_toolpath(path, segments, meta)
+		except (IOError, OSError):
+			return
+		self.evict()
+
+	def evict(self):
+		"""Remove the least recently used entries over the cache size."""
+		entries = []
+		for entry in os.listdir(self.directory):
+			path = os.path.join(self.directory, entry)
+			try:
+				st = os.stat(path)
+			except OSError:
+				continue
+			entries.append((st.st_mtime, st.st_size, path))
+		entries.sort()
+		total = sum(size for mtime, size, path in entries)
+		while (entries and total > self.max_bytes):
+			mtime, size, path = entries.pop(0)
+			self.remove(path)
+			total -= size
+
+	def remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+def tokenize_gcode(line):
+	"""
+	Split one line of G-code into its words.
+	
+	The line is scanned once, left to right, by a single precompiled
+	pattern: parenthesised comments and everything after a ';' are
+	skipped, every other letter followed by a number is returned, so a
+	line may carry several G words (e.g. "G17 G2 X1 Y1 I0.5").
+	Letters are case insensitive.
+	
+	@parameters:
+	line of G-code
+	
+	@return:
+	list of (word, value) pairs, word an upper case letter, value a float
+	
+	"""
+	return [(word, float(value))
+		for word, value in _GCODE_WORD_RE.findall(line.upper()) if word]
+
+def parse_gcode_file(name, rot_ang=0.0, xshift=0, yshift=0, processes=1, cancel=None, modal=None, cache=None):
+	"""
+	Parse a whole G-code file, or get it from a cache.
+	
+	@parameters:
+	file name
+	rotation angle (radians) and X/Y shift applied to the moves
+	number of worker processes for a big file, see parse_gcode_parallel
+	threading.Event that stops the parsing when set
+	MODAL set to the state at the end of the file
+	PARSE_CACHE to look the file up in and keep it in
+	
+	@return:
+	SEGMENTS of the moves, raises IOError if the file can't be read
+	
+	"""
+	if modal is None:
+		modal = MODAL()
+	if is_toolpath(name):
+		return read_toolpath(name, modal)
+	segments = cache.load(name, rot_ang, xshift, yshift, modal) if cache else None
+	if (segments is not None): # a file without moves is a hit too
+		return segments
+	segments = SEGMENTS()
+	if (processes > 1 and file_size(name) >= _PARALLEL_BYTES and not compression(name)):
+		for chunk, nbytes in parse_gcode_parallel(name, rot_ang, xshift, yshift, processes, cancel, modal):
+			segments.extend(chunk)
+	else:
+		f = open_gcode(name)
+		try:
+			for chunk, lines, nbytes in parse_gcode_chunks(f, rot_ang, xshift, yshift, modal=modal):
+				if (cancel and cancel.isSet()):
+					break
+				segments.extend(chunk)
+		finally:
+			f.close()
+	segments.trim()
+	if (cache and not (cancel and cancel.isSet())):
+		cache.store(name, rot_ang, xshift, yshift, segments, modal)
+	return segments
+
+def _parse_file_job(job):
+	"""parse_files() worker: parse_gcode_file() of job (index, name, rot_ang, xshift, yshift, cache)."""
+	n, name, rot_ang, xshift, yshift, cache = job
+	modal = MODAL()
+	try:
+		return n, parse_gcode_file(name, rot_ang, xshift, yshift, modal=modal, cache=cache), modal, None
+	except IOError:
+		return job[0], None, None, "Unable to open the file" + job[1] + "\n"
+
+def parse_files(names, rot_ang=0.0, xshift=0, yshift=0, processes=None, cancel=None, cache=None):
+	"""
+	Parse G-code files in parallel, each file in a worker process.
+	
+	The workers send back the compact SEGMENTS columns only.
+	
+	@parameters:
+	list of file names
+	rotation angle (radians) and X/Y shift applied to the moves
+	number of worker processes, default one per CPU
+	threading.Event that stops the parsing when set
+	PARSE_CACHE, see parse_gcode_file
+	
+	@return:
+	generator of (index, segments, modal, error) in the order the files
+	are done: index in names, the SEGMENTS of the file and the MODAL state
+	at its end, or None, None and an error message
+	
+	"""
+	jobs = [(n, name, rot_ang, xshift, yshift, cache) for n, name in enumerate(names)]
+	processes = processes or multiprocessing.cpu_count()
+	if (len(jobs) == 1):
+		modal = MODAL()
+		try:
+			yield 0, parse_gcode_file(names[0], rot_ang, xshift, yshift, processes, cancel, modal, cache), modal, None
+		except IOError:
+			yield 0, None, None, "Unable to open the file" + names[0] + "\n"
+		return
+	if not jobs:
+		return
+	pool = multiprocessing.Pool(min(len(jobs), processes))
+	try:
+		for result in pool_results(pool.imap_unordered(_parse_file_job, jobs), len(jobs), cancel):
+			yield result
+	finally:
+		pool.terminate()
+		pool.join()
+
+def pool_results(results, count, cancel=None):
+	"""
+	Wait for the results of a multiprocessing.Pool imap, checking for
+	cancellation while waiting.
+	
+	@parameters:
+	imap or imap_unordered iterator
+	number of results
+	threading.Event that stops the waiting when set
+	
+	"""
+	for n in xrange(count):
+		while True:
+			if (cancel and cancel.isSet()):
+				return
+			try:
+				result = results.next(0.2)
+			except multiprocessing.TimeoutError:
+				continue
+			break
+		yield result
+
+def parse_gcode_parallel(name, rot_ang=0.0, xshift=0, yshift=0, processes=None, cancel=None, modal=None):
+	"""
+	Parse one G-code file in parallel, in byte ranges of whole lines.
+	
+	A range can't be parsed before the modal state (position, feed, motion
+	mode, plane, line number) left by the lines ahead of it is known. So
+	the workers first pre-scan their ranges with a few regular expression
+	searches for the last modal words (scan_gcode_range), the main process
+	chains these into the modal state at the start of every range, then
+	the workers parse the ranges from those checkpoints. The stitched
+	chunks are identical to a serial parse.
+	
+	@parameters:
+	file name
+	rotation angle (radians) and X/Y shift applied to the moves
+	number of worker processes, default one per CPU
+	threading.Event that stops the parsing when set
+	MODAL set to the state at the end of the file
+	
+	@return:
+	generator of (segments, nbytes) in file order: the SEGMENTS of the next
+	range and the bytes parsed so far
+	
+	"""
+	processes = processes or multiprocessing.cpu_count()
+	ranges = gcode_ranges(name, 4 * processes)
+	pool = multiprocessing.Pool(processes)
+	try:
+		# phase 1: modal words of every range
+		jobs = [(name, start, end) for start, end in ranges]
+		scans = list(pool_results(pool.imap(_scan_range_job, jobs), len(jobs), cancel))
+		if (len(scans) < len(jobs)):
+			return
+		# modal state checkpoints at the start of the ranges
+		checkpoint = MODAL()
+		jobs = []
+		for (start, end), scan in zip(ranges, scans):
+			jobs.append((name, start, end, copy.copy(checkpoint), rot_ang, xshift, yshift))
+			checkpoint.update(scan)
+			checkpoint.offset = end
+		if (modal is not None):
+			modal.__init__(**vars(checkpoint))
+		# phase 2: parse the ranges from their checkpoints
+		results = pool.imap(_parse_range_job, jobs)
+		for n, segments in enumerate(pool_results(results, len(jobs), cancel)):
+			yield segments, ranges[n][1]
+	finally:
+		pool.terminate()
+		pool.join()
+
+def gcode_ranges(name, count):
+	"""
+	Split a file into about count byte ranges starting at line starts.
+	
+	@return:
+	list of (start, end) byte offsets
+	
+	"""
+	size = file_size(name)
+	offsets = [0]
+	f = open(name,'rb')
+	try:
+		for n in xrange(1, count):
+			f.seek(max(size * n / count - 1, offsets[-1]))
+			f.readline() # to the start of the next line
+			if (f.tell() >= size):
+				break
+			if (f.tell() > offsets[-1]):
+				offsets.append(f.tell())
+	finally:
+		f.close()
+	offsets.append(size)
+	return zip(offsets[:-1], offsets[1:])
+
+def read_range(name, start, end):
+	"""Read the bytes start to end of a file."""
+	f = open(name,'rb')
+	try:
+		f.seek(start)
+		return f.read(end - start)
+	finally:
+		f.close()
+
+def scan_gcode_range(text):
+	"""
+	Pre-scan G-code for the modal words that are in effect after it.
+	
+	@parameters:
+	G-code text of whole lines
+	
+	@return:
+	dict of the MODAL attributes set in the text (x, y, z, feed, style,
+	plane) and lines, the number of line ends
+	
+	"""
+	scan = {'lines': text.count('\n')}
+	text = _GCODE_LINE_COMMENT_RE.sub('', text.upper())
+	for word, attr in (('X', 'x'), ('Y', 'y'), ('Z', 'z'), ('F', 'feed')):
+		values = _GCODE_WORD_RES[word].findall(text)
+		if values:
+			scan[attr] = float(values[-1])
+	for value in reversed(_GCODE_WORD_RES['G'].findall(text)):
+		g = int(float(value))
+		if (g <= 3):	# G0..G3 motion mode
+			scan.setdefault('style', g)
+		elif (g >= 17 and g <= 19):	# plane
+			scan.setdefault('plane', g - 17)
+		if ('style' in scan and 'plane' in scan):
+			break
+	return scan
+
+def _scan_range_job(job):
+	"""parse_gcode_parallel() phase 1 worker: scan_gcode_range() of job (name, start, end)."""
+	return scan_gcode_range(read_range(*job))
+
+def _parse_range_job(job):
+	"""
+	parse_gcode_parallel() phase 2 worker: parse the byte range of job
+	(name, start, end, modal, rot_ang, xshift, yshift).
+	
+	"""
+	name, start, end, modal, rot_ang, xshift, yshift = job
+	segments = SEGMENTS()
+	for chunk, lines, nbytes in parse_gcode_chunks(StringIO(read_range(name, start, end)),
+			rot_ang, xshift, yshift, modal=modal):
+		segments.extend(chunk)
+	segments.trim()
+	return segments
+
+def open_gcode(name):
+	"""
+	Open a G-code file for reading its lines. Files compressed with gzip,
+	bzip2 or xz (told by their first bytes, not their name) are opened as
+	a COMPRESSED_FILE, decompressed while they are read.
+	
+	Plain files are read in binary mode, so that MODAL.offset counts the
+	bytes of the file on every platform (the tokenizer ignores the \\r
+	of CRLF line ends).
+	
+	"""
+	kind = compression(name)
+	if (kind is None):
+		return open(name,'rb')
+	return COMPRESSED_FILE(name, kind)
+
+def is_stream(name):
+	"""
+	True for the name of a live stream, see open_stream: '-', 'tcp:...',
+	'unix:...' or the name of a named pipe.
+	
+	"""
+	if (name == '-' or name.startswith('tcp:') or name.startswith('unix:')):
+		return True
+	st = file_stat(name)
+	return bool(st and stat.S_ISFIFO(st.st_mode))
+
+def open_stream(source):
+	"""
+	Open a live G-code stream for read_lines.
+	
+	@parameters:
+	'-' - standard input
+	'tcp:HOST:PORT' - connect to a TCP socket (HOST defaults to localhost)
+	'unix:PATH' - connect to a Unix domain socket
+	any other name - open a file, e.g. a named pipe (FIFO); this waits for
+	  a writer to open the pipe
+	
+	@return:
+	object with fileno() and close(), raises IOError (socket.error is
+	one) if the stream can't be opened
+	
+	"""
+	if (source == '-'):
+		return sys.stdin
+	if source.startswith('tcp:'):
+		host, port = source[4:].rsplit(':', 1)
+		return socket.create_connection((host or 'localhost', int(port)))
+	if source.startswith('unix:'):
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		sock.connect(source[5:])
+		return sock
+	return open(source,'rb', 0)
+
+def read_lines(stream, interval=0.1, cancel=None):
+	"""
+	Read the lines of a live stream as they come, in batches.
+	
+	The stream is waited on with select() and read with os.read() as soon
+	as it has data, so a quiet stream never blocks for longer than
+	interval, and cancel is noticed. Needs select() on the stream, which
+	Windows only has for sockets.
+	
+	@parameters:
+	object with fileno(), see open_stream
+	seconds to collect the lines of a batch
+	threading.Event that stops the reading when set
+	
+	@return:
+	generator of lists of the whole lines received in about interval
+	seconds, ends at the end of the stream (with the last line, if it has
+	no line end)
+	
+	"""
+	fd = stream.fileno()
+	rest = '' # start of a line still being received
+	while not (cancel and cancel.isSet()):
+		lines = []
+		deadline = time.time() + interval
+		while True:
+			timeout = deadline - time.time()
+			if (timeout <= 0 or not select.select([fd], [], [], timeout)[0]):
+				break
+			data = os.read(fd, 65536)
+			if not data: # end of the stream
+				if rest:
+					lines.append(rest)
+				if lines:
+					yield lines
+				return
+			parts = (rest + data).split('\n')
+			rest = parts.pop()
+			lines.extend(part + '\n' for part in parts)
+		if lines:
+			yield lines
+
+def compression(name):
+	"""Compression of a file: 'gzip', 'bz2', 'xz' or None."""
+	f = open(name,'rb')
+	try:
+		magic = f.read(6)
+	finally:
+		f.close()
+	for prefix, kind in _COMPRESSIONS:
+		if magic.startswith(prefix):
+			return kind
+	return None
+
+def file_size(name):
+	"""Size of a file, 0 if it can't be read."""
+	try:
+		return os.path.getsize(name)
+	except OSError:
+		return 0
+
+def file_stat(name):
+	"""os.stat() of a file, None if it can't be read."""
+	try:
+		return os.stat(name)
+	except OSError:
+		return None
+
+def file_stamp(name, offset, stat=None):
+	"""
+	Stamp of a file to tell later whether it changed, or only grew.
+	
+	@parameters:
+	file name
+	byte offset the file was parsed up to
+	file_stat() to use, default the current one
+	
+	@return:
+	(size, mtime, hash of the bytes before offset, byte before offset),
+	None if the file can't be read
+	
+	The whole parsed part is hashed, an edit anywhere in it changes the
+	stamp; that costs a read of the file, far less than parsing it.
+	
+	"""
+	stat = stat or file_stat(name)
+	if (stat is None):
+		return None
+	digest = hashlib.sha1()
+	last = ''
+	try:
+		f = open(name,'rb')
+		try:
+			left = offset
+			while (left > 0):
+				block = f.read(min(left, 1 << 20))
+				if not block:
+					break # the file shrank
+				digest.update(block)
+				last = block[-1:]
+				left -= len(block)
+		finally:
+			f.close()
+	except IOError:
+		return None
+	return stat.st_size, stat.st_mtime, digest.hexdigest(), last
+
+def is_toolpath(name):
+	"""True for the name of a toolpath file (.gtp), see read_toolpath."""
+	return name.lower().endswith('.gtp')
+
+def read_toolpath(name, modal=None, meta=None):
+	"""
+	Open a toolpath file: parsed moves, memory-mapped.
+	
+	The moves are not read but mapped, so opening a file of any size takes
+	no time, the columns of the SEGMENTS are read only NumPy views of the
+	file, and only the pages of the moves used are ever read in memory.
+	
+	A toolpath file holds the SEGMENTS of a G-code file as they were
+	parsed (rotation and shift included). All numbers are little endian,
+	every part starts at a multiple of 16 bytes (zero padded):
+	
+	header, 80 bytes (struct '<8sIIQQ6d'):
+	  magic 'PYGCVTP\\0', format version (1), moves per block B,
+	  number of moves N, length M of the metadata,
+	  bounds: minimum x, y, z, maximum x, y, z (float64)
+	metadata: M bytes of JSON, a dictionary, e.g. the G-code file name
+	  and its MODAL state at the end ("name", "modal")
+	block bounds: ceil(N/B) x [min x, y, z, max x, y, z] float32, the
+	  box of every B moves in the file order, arcs included (see
+	  block_bounds)
+	the columns of SEGMENTS, one after the other, N rows each:
+	  start, end, center (3 x float32), style, plane (int8),
+	  line (int32), speed (float32)
+	
+	@parameters:
+	file name
+	MODAL set to the metadata "modal", if given
+	dictionary updated with the metadata, if given
+	
+	@return:
+	SEGMENTS, raises IOError if the file can't be read or isn't a toolpath file
+	
+	"""
+	try:
+		data = np.memmap(name, np.uint8, 'r')
+		header = struct.unpack(_TOOLPATH_HEADER, data[:struct.calcsize(_TOOLPATH_HEADER)].tostring())
+		magic, version, block, count, length = header[:5]
+		if (magic != _TOOLPATH_MAGIC or version != _TOOLPATH_VERSION or block != _TOOLPATH_BLOCK):
+			raise IOError("Not a toolpath file " + name)
+		offset = struct.calcsize(_TOOLPATH_HEADER)
+		info = json.loads(data[offset:offset + length].tostring())
+		offset = _aligned(offset + length)
+		segments = SEGMENTS()
+		parts = [('blocks', np.float32, ((count + block - 1) // block, 2, 3))]
+		parts += [(column, dtype, (count, width) if width else (count,))
+			for column, dtype, width in SEGMENTS._columns]
+		for column, dtype, shape in parts:
+			dtype = np.dtype(dtype).newbyteorder('<')
+			size = dtype.itemsize * int(np.prod(shape))
+			if (offset + size > len(data)):
+				raise IOError("Truncated toolpath file " + name)
+			setattr(segments, column, data[offset:offset + size].view(dtype).reshape(shape))
+			offset = _aligned(offset + size)
+	except (ValueError, struct.error, KeyError):
+		raise IOError("Broken toolpath file " + name)
+	if count:
+		segments.bounds = np.array(header[5:]).reshape(2,3)
+	if (modal is not None and 'modal' in info):
+		modal.__init__(**info['modal'])
+	if (meta is not None):
+		meta.update(info)
+	return segments
+
+def write_toolpath(name, segments, meta=None):
+	"""
+	Save SEGMENTS as a toolpath file, see read_toolpath for the format.
+	
+	The file is written under a temporary name and renamed, so a toolpath
+	file is never seen half written, nor overwritten while it is mapped.
+	
+	@parameters:
+	file name
+	SEGMENTS
+	dictionary of metadata, saved as JSON
+	
+	"""
+	info = json.dumps(meta or {})
+	bounds = segments.bounds if segments.bounds is not None else np.zeros((2,3))
+	blocks = segments.blocks if segments.blocks is not None else block_bounds(segments, _TOOLPATH_BLOCK)
+	fd, tmp = tempfile.mkstemp('.tmp', '', os.path.dirname(os.path.abspath(name)))
+	f = os.fdopen(fd, 'wb')
+	try:
+		f.write(struct.pack(_TOOLPATH_HEADER, _TOOLPATH_MAGIC, _TOOLPATH_VERSION, _TOOLPATH_BLOCK,
+			len(segments), len(info), *np.ravel(bounds)))
+		f.write(info)
+		for values, dtype in [(blocks, np.float32)] + [(getattr(segments, column), dtype)
+				for column, dtype, width in SEGMENTS._columns]:
+			f.write('\0' * (_aligned(f.tell()) - f.tell()))
+			np.asarray(values, np.dtype(dtype).newbyteorder('<')).tofile(f)
+		f.close()
+		os.rename(tmp, name)
+	except:
+		f.close()
+		os.remove(tmp)
+		raise
+
+def _aligned(offset):
+	"""offset rounded up to a multiple of 16 bytes."""
+	return offset + (-offset % 16)
+
+def block_bounds(segments, size):
+	"""
+	Bounding boxes of the moves in blocks of size moves, file order; the
+	whole circle of an arc is counted in, so the box holds its bulge.
+	
+	@return:
+	(B,2,3) float32 array of [minima, maxima]
+	
+	"""
+	blocks = np.empty(((len(segments) + size - 1) // size, 2, 3), np.float32)
+	for n in xrange(len(blocks)):
+		part = segments.view(n * size, (n + 1) * size)
+		lo = np.minimum(part.start, part.end)
+		hi = np.maximum(part.start, part.end)
+		arc = part.style >= 2
+		if arc.any():
+			center = part.center[arc]
+			r = np.sqrt(((part.start[arc] - center) ** 2).sum(axis=1))[:,np.newaxis]
+			lo[arc] = np.minimum(lo[arc], center - r)
+			hi[arc] = np.maximum(hi[arc], center + r)
+		blocks[n,0] = lo.min(axis=0)
+		blocks[n,1] = hi.max(axis=0)
+	return blocks
+
+def iter_segments(source, rot_ang=0.0, xshift=0, yshift=0, chunk_lines=50000, modal=None):
+	"""
+	Parse G-code into batches of moves, streaming.
+	
+	Only one batch of lines is held at a time, so memory stays bounded by
+	chunk_lines whatever the size of the source.
+	
+	@parameters:
+	file name (of a file compressed or not, see open_gcode), open file
+	or other stream with readline(), or any iterable of lines
+	rotation angle (radians) and X/Y shift applied to the moves
+	number of lines per batch
+	MODAL state to start from, it is kept up to date at every batch
+	(modal.line and modal.offset tell how far the source was read)
+	
+	@return:
+	generator of SEGMENTS, raises IOError if the file can't be read
+	
+	"""
+	if isinstance(source, basestring):
+		f = open_gcode(source)
+		try:
+			for segments in iter_segments(f, rot_ang, xshift, yshift, chunk_lines, modal):
+				yield segments
+		finally:
+			f.close()
+		return
+	if (hasattr(source, 'readline') and not hasattr(source, '__iter__')):
+		source = iter(source.readline, '')
+	for segments, lines, nbytes in parse_gcode_chunks(source, rot_ang, xshift, yshift, chunk_lines, modal):
+		yield segments
+
+def parse_gcode_chunks(f, rot_ang=0.0, xshift=0, yshift=0, chunk_lines=50000, modal=None):
+	"""
+	Parse G-code lines into SEGMENTS, a chunk of lines at a time.
+	
+	@parameters:
+	file, or any iterable of lines
+	rotation angle (radians) and X/Y shift applied to the moves
+	number of lines per chunk
+	MODAL state to start from, at the file position of its offset; it is
+	kept up to date at every chunk
+	
+	@return:
+	generator of (segments, lines, nbytes): the closed SEGMENTS of the
+	moves of the next chunk, and the number of lines and bytes read so far
+	
+	"""
+	if modal is None:
+		modal = MODAL()
+	x = modal.x
+	y = modal.y
+	z = modal.z
+	pre_x = x
+	pre_y = y
+	pre_z = z
+	s = modal.feed
+	l = modal.line
+	style = modal.style
+	plane = modal.plane
+	offset = modal.offset
+	first = l
+	chunk_end = l - 1 + chunk_lines
+	
+	segments = SEGMENTS()
+	append = segments.append
+	nbytes = 0
+	for gcode in f:
+		nbytes += len(gcode)
+		flag = 0
+		arc_r = 0
+		i = 0.0 # I,J,K,R are not modal
+		j = 0.0
+		k = 0.0
+
+		#parse G-code, one pass over the line for all its words
+		for word, value in tokenize_gcode(gcode):
+			if (word == 'G'):
+				g = int(value)
+				if (g <= 3):	# G0..G3 motion mode
+					style = g
+				elif (g == 17):	# XY plane
+					plane = 0
+				elif (g == 18):	# XZ plane
+					plane = 1
+				elif (g == 19):	# YZ plane
+					plane = 2
+			elif (word == 'X'):
+				x = value
+				flag = 1
+			elif (word == 'Y'):
+				y = value
+				flag = 1
+			elif (word == 'Z'):
+				z = value
+				flag = 1
+			elif (word == 'F'):
+				s = value
+			elif (word == 'I'):
+				i = value
+			elif (word == 'J'):
+				j = value
+			elif (word == 'K'):
+				k = value
+			elif (word == 'R'):
+				r = value
+				arc_r = 1
+
+		if (style == 1 or style == 0): # coordinated|fast move
+			if (flag):
+				append(style,l,s,plane,pre_x,pre_y,pre_z,x,y,z)
+				
+		elif (style == 2 or style == 3): # cw|ccw arc feed
+			if (flag):
+				if (arc_r):
+					c1,c2 = calc_center(POINT(pre_x,pre_y,pre_z),POINT(x,y,z),r,plane)
+					# c1 is the center of the short ccw arc
+					if ((style == 3) == (r > 0)):
+						center = c1
+					else:
+						center = c2
+					cx = center.x
+					cy = center.y
+					cz = center.z
+				else:	# I,J,K are offsets from the start point
+					cx = pre_x
+					cy = pre_y
+					cz = pre_z
+					if (plane != 2):
+						cx += i
+					if (plane != 1):
+						cy += j
+					if (plane != 0):
+						cz += k
+				append(style,l,s,plane,pre_x,pre_y,pre_z,x,y,z,cx,cy,cz)
+		
+		pre_x = x
+		pre_y = y
+		pre_z = z					
+		l += 1
+
+		if (l > chunk_end):
+			modal.__init__(x, y, z, s, style, plane, l, offset + nbytes)
+			segments.close()
+			if (rot_ang or xshift or yshift):
+				segments.rotate_shift(rot_ang, xshift, yshift)
+			yield segments, l-first, nbytes
+			segments = SEGMENTS()
+			append = segments.append
+			chunk_end += chunk_lines
+
+	modal.__init__(x, y, z, s, style, plane, l, offset + nbytes)
+	segments.close()
+	if (rot_ang or xshift or yshift):
+		segments.rotate_shift(rot_ang, xshift, yshift)
+	yield segments, l-first, nbytes
+
+def points_bounds(points):
+	"""
+	Bounding box of points.
+	
+	@parameters:
+	(N,3) array of points, N > 0
+	
+	@return:
+	(2,3) array [minima, maxima]
+	
+	"""
+	return np.array((points.min(axis=0), points.max(axis=0)), np.float64)
+
+def merge_bounds(b1, b2):
+	"""
+	Smallest bounding box holding two [minima, maxima] boxes, either may
+	be None (empty).
+	
+	"""
+	if (b1 is None):
+		return b2
+	if (b2 is None):
+		return b1
+	return np.array((np.minimum(b1[0], b2[0]), np.maximum(b1[1], b2[1])))
+
+def calc_center(p1,p2,r,plane):
+	"""
+	Calculate the centers of the two arcs of radius r through two points.
+	
+	@parameters:
+	point1
+	point2
+	radius
+	plane:
+	0 - XY
+	1 - ZX
+	2 - YZ
+	
+	@return:
+	[c1, c2], c1 on the left of the chord point1->point2 (center of the
+	counter-clockwise arc shorter than half a circle), c2 on its right
+	
+	"""
+	a,b = _PLANE_AXES[plane]
+	p = [p1.x, p1.y, p1.z]
+	q = [p2.x, p2.y, p2.z]
+	da = q[a] - p[a]
+	db = q[b] - p[b]
+	d = sqrt(da*da + db*db)
+	c1 = list(p)
+	c1[a] = (p[a] + q[a]) / 2.0
+	c1[b] = (p[b] + q[b]) / 2.0
+	c2 = list(c1)
+	if (d > 0):
+		h = sqrt(max(r*r - d*d/4.0, 0.0)) / d
+		c1[a] -= db*h
+		c1[b] += da*h
+		c2[a] += db*h
+		c2[b] -= da*h
+	return [POINT(*c1), POINT(*c2)]
+
+def rot_point(point, center, angle):
+	dx = center.x - point.x
+	dy = point.y - center.y
+	initial_angle = atan2(dy,dx)
+	r = sqrt(dx*dx + dy*dy)
+	ch_angle = initial_angle + angle
+	point.x = center.x - r * cos(ch_angle)
+	point.y = center.y + r * sin(ch_angle)
+	return point
+
+def shift_point(point, xshift, yshift):
+	point.x = point.x + xshift
+	point.y = point.y + yshift
+	return point
+
+def scale_up(point, mag):
+	point.x = point.x * mag
+	point.y = point.y * mag
+	return point
@@ -0,0 +1,867 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Headless renderer of the G-code viewer
+
+Projects parsed moves (see gcodeparser) onto the XY, XZ, YZ and XYZ view
+planes, the same views the viewer draws, and renders them to PNG or SVG
+files without wxPython or a display, for batch thumbnails. The view
+projections here are shared with the viewer, and so is rasterize(), the
+NumPy rasterizer drawing tiles of an image on several processes.
+
+render_main() is the command line entry point, run as
+
+  python gcoderender.py [options] FILE|DIRECTORY ...
+
+It renders every G-code file given, or found under the directories
+given, in a pool of worker processes and prints the time taken by each
+file. See render_main() for the options.
+
+Dependencies:
+NumPy (the images are drawn in arrays)
+gcodeparser (the G-code parser)
+
+"""
+import numpy as np
+from math import *
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import itertools
+import collections
+import struct
+import zlib
+
+from gcodeparser import *
+from gcodeparser import _PLANE_AXES
+
+# (horizontal, vertical) axis index of the XY, XZ and YZ view planes
+_VIEW_AXES = ((0,1), (0,2), (1,2))
+# rotation angles (theta, phi, psi) of the XYZ view, see view_matrix
+_XYZ_ANGLES = (pi/4.0, pi/4.0, 0.0)
+_VIEW_MATRICES = collections.OrderedDict()
+_VIEW_MATRICES_MAX = 16 # orbiting the XYZ view turns it to new angles all the time
+_TRANSFORM_MATRICES = {}
+
+# file name suffix of the view planes
+_VIEW_NAMES = ('xy', 'xz', 'yz', 'xyz')
+
+# RGB of the wxPython colour database names the viewer offers
+_COLOURS = {
+	'AQUAMARINE': (112,219,147), 'BLACK': (0,0,0), 'BLUE': (0,0,255),
+	'BLUE VIOLET': (159,95,159), 'BROWN': (165,42,42), 'CADET BLUE': (95,159,159),
+	'CORAL': (255,127,0), 'CORNFLOWER BLUE': (66,66,111), 'CYAN': (0,255,255),
+	'DARK GREY': (47,47,47), 'DARK GREEN': (47,79,47), 'DARK OLIVE GREEN': (79,79,47),
+	'DARK ORCHID': (153,50,204), 'DARK SLATE BLUE': (107,35,142), 'DARK SLATE GREY': (47,79,79),
+	'DARK TURQUOISE': (112,147,219), 'DIM GREY': (84,84,84), 'FIREBRICK': (142,35,35),
+	'FOREST GREEN': (35,142,35), 'GOLD': (204,127,50), 'GOLDENROD': (219,219,112),
+	'GREY': (128,128,128), 'GREEN': (0,255,0), 'GREEN YELLOW': (147,219,112),
+	'INDIAN RED': (79,47,47), 'KHAKI': (159,159,95), 'LIGHT BLUE': (191,216,216),
+	'LIGHT GREY': (192,192,192), 'LIGHT STEEL BLUE': (143,143,188), 'LIME GREEN': (50,204,50),
+	'MAGENTA': (255,0,255), 'MAROON': (142,35,107), 'MEDIUM AQUAMARINE': (50,204,153),
+	'MEDIUM BLUE': (50,50,204), 'MEDIUM FOREST GREEN': (107,142,35), 'MEDIUM GOLDENROD': (234,234,173),
+	'MEDIUM ORCHID': (147,112,219), 'MEDIUM SEA GREEN': (66,111,66), 'MEDIUM SLATE BLUE': (127,0,255),
+	'MEDIUM SPRING GREEN': (127,255,0), 'MEDIUM TURQUOISE': (112,219,219), 'MEDIUM VIOLET RED': (219,112,147),
+	'MIDNIGHT BLUE': (47,47,79), 'NAVY': (35,35,142), 'ORANGE': (204,50,50),
+	'ORANGE RED': (255,0,127), 'ORCHID': (219,112,219), 'PALE GREEN': (143,188,143),
+	'PINK': (188,143,234), 'PLUM': (234,173,234), 'PURPLE': (176,0,255),
+	'RED': (255,0,0), 'SALMON': (111,66,66), 'SEA GREEN': (35,142,107),
+	'SIENNA': (142,107,35), 'SKY BLUE': (50,153,204), 'SLATE BLUE': (0,127,255),
+	'SPRING GREEN': (0,255,127), 'STEEL BLUE': (35,107,142), 'TAN': (219,147,112),
+	'THISTLE': (216,191,216), 'TURQUOISE': (173,234,234), 'VIOLET': (79,47,79),
+	'VIOLET RED': (204,50,153), 'WHEAT': (216,216,191), 'WHITE': (255,255,255),
+	'YELLOW': (255,255,0), 'YELLOW GREEN': (153,204,50),
+	}
+_DEFAULT_COLOUR = 'CADET BLUE' # feed moves, as OpenFiles
+_MOVE_COLOUR = 'BLUE' # rapid moves, as Paint
+_BACKGROUND = 'WHITE'
+_RAPID_DASHES = (7, 3, 1, 3) # pixels on, off, on, off: wx.DOT_DASH
+_AXIS_LENGTH = 45.0 # pixels, as Paint.DrawAxis
+_ARC_TOLERANCE = 0.25 # chord error of the lines drawn for an arc (pixels)
+_ARC_PIECES_MAX = 256 # lines drawn per arc, at most
+
+# file names searched for in directories, compressed or not (see open_gcode)
+_GCODE_SUFFIXES = ('.ngc', '.nc', '.gcode', '.tap', '.gtp')
+_COMPRESSED_SUFFIXES = ('', '.gz', '.bz2', '.xz')
+
+# pixels drawn per pass of draw_lines, bounds its memory
+_RASTER_BATCH = 1 << 22
+# side of the tiles rasterize() hands out to worker processes (pixels)
+_RASTER_TILE = 256
+
+def view_matrix(theta, phi, psi):
+	"""
+	3D to 2D projection matrix of the XYZ view.
+	
+	Rotation by theta around z, then phi around x with the height added
+	to the vertical, then psi around y, as one 3x3 matrix: rows give the
+	horizontal, vertical and depth coordinates. Matrices are cached for
+	the last _VIEW_MATRICES_MAX sets of angles.
+	
+	@parameters:
+	rotation angles theta, phi, psi (radians)
+	
+	"""
+	key = (theta, phi, psi)
+	m = _VIEW_MATRICES.get(key)
+	if (m is None):
+		ct, st = cos(theta), sin(theta)
+		cf, sf = cos(phi), sin(phi)
+		cp, sp = cos(psi), sin(psi)
+		m = np.array((
+			( cp*ct - sp*sf*st, -cp*st - sp*sf*ct, 0.0),
+			( cf*st, cf*ct, 1.0),
+			(-sf*cp*st - sp*ct, -sf*cp*ct + sp*st, 0.0)))
+		m.flags.writeable = False
+		if (len(_VIEW_MATRICES) >= _VIEW_MATRICES_MAX):
+			_VIEW_MATRICES.popitem(last=False)
+		_VIEW_MATRICES[key] = m
+	return m
+
+def transform_matrix(rot_ang=0.0, xshift=0.0, yshift=0.0, unit=1.0):
+	"""
+	Affine transform of the moves of a file.
+	
+	Scale by unit (see set_unit), rotate clockwise by rot_ang (radians)
+	around the origin, then shift by xshift, yshift: the same as
+	SEGMENTS.rotate_shift() for unit 1. Matrices are cached per set of
+	parameters.
+	
+	@return:
+	(3,4) array [A | t] mapping a point p to A p + t
+	
+	"""
+	key = (rot_ang, xshift, yshift, unit)
+	m = _TRANSFORM_MATRICES.get(key)
+	if (m is None):
+		c = cos(rot_ang) * unit
+		s = sin(rot_ang) * unit
+		m = np.array((
+			( c, s, 0.0, xshift),
+			(-s, c, 0.0, yshift),
+			(0.0, 0.0, unit, 0.0)))
+		m.flags.writeable = False
+		_TRANSFORM_MATRICES[key] = m
+	return m
+
+def transform_bounds(bounds, transform):
+	"""
+	Bounding box of a transformed [minima, maxima] box, holding its eight
+	transformed corners; bounds itself for transform None (identity).
+	
+	"""
+	if (bounds is None or transform is None):
+		return bounds
+	corners = np.array([(x, y, z) for x in bounds[:,0] for y in bounds[:,1] for z in bounds[:,2]])
+	corners = np.dot(corners, transform[:,:3].T) + transform[:,3]
+	return np.array((corners.min(axis=0), corners.max(axis=0)))
+
+def project_lines(p1, p2, view, angles=None, transform=None):
+	"""
+	3D to 2D projection of line segments onto a view plane.
+	
+	A transform of the points is folded into the projection, so that
+	transformed lines cost a single matrix product.
+	
+	@parameters:
+	(N,3) array of start points
+	(N,3) array of end points
+	view plane: 0 XY, 1 XZ, 2 YZ, 3 XYZ (see view_matrix)
+	rotation angles of the XYZ view, default _XYZ_ANGLES
+	(3,4) transform of the points (see transform_matrix), None for none
+	
+	@return:
+	(N,4) array of view plane coordinates x1,y1,x2,y2
+	
+	"""
+	lines = np.empty((len(p1), 4))
+	if (transform is not None):
+		if (view == 3):
+			m = view_matrix(*(angles or _XYZ_ANGLES))[:2]
+		else:
+			m = np.eye(3)[list(_VIEW_AXES[view])]
+		m = np.dot(m, transform)
+		lines[:,0:2] = np.dot(p1, m[:,:3].T) + m[:,3]
+		lines[:,2:4] = np.dot(p2, m[:,:3].T) + m[:,3]
+	elif (view == 3):	#XYZ
+		m = view_matrix(*(angles or _XYZ_ANGLES))[:2].T
+		lines[:,0:2] = np.dot(p1, m)
+		lines[:,2:4] = np.dot(p2, m)
+	else:	#XY, XZ, YZ
+		u,v = _VIEW_AXES[view]
+		lines[:,0] = p1[:,u]
+		lines[:,1] = p1[:,v]
+		lines[:,2] = p2[:,u]
+		lines[:,3] = p2[:,v]
+	return lines
+
+def project_bounds(boxes, view, angles=None, transform=None):
+	"""
+	3D to 2D projection of bounding boxes onto a view plane.
+	
+	@parameters:
+	(N,2,3) array of [minima, maxima] boxes
+	view plane, rotation angles and transform, see project_lines
+	
+	@return:
+	(N,4) array of the view plane boxes holding them: u0,v0,u1,v1
+	
+	"""
+	lo = boxes[:,0]
+	hi = boxes[:,1]
+	corners = []
+	for x in (lo, hi):
+		for y in (lo, hi):
+			# a pair of opposite corners per line
+			p1 = np.column_stack((x[:,0], y[:,1], lo[:,2]))
+			p2 = np.column_stack((x[:,0], y[:,1], hi[:,2]))
+			corners.append(project_lines(p1, p2, view, angles, transform))
+	corners = np.array(corners).reshape(4, -1, 2, 2) # (line, box, end, uv)
+	return np.column_stack((corners[...,0].min(axis=(0,2)), corners[...,1].min(axis=(0,2)),
+		corners[...,0].max(axis=(0,2)), corners[...,1].max(axis=(0,2))))
+
+def snap_lines(lines, size):
+	"""
+	Snap line end points to the centers of a grid and drop the lines that
+	become points or duplicates.
+	
+	@parameters:
+	(N,4) array of lines x1,y1,x2,y2, or (N,6) x1,y1,z1,x2,y2,z2
+	grid size
+	
+	@return:
+	(M,4) or (M,6) array of snapped lines, M <= N
+	
+	"""
+	d = lines.shape[1] // 2
+	q = np.floor(lines / size)
+	q = q[(q[:,:d] != q[:,d:]).any(axis=1)]
+	# a line and its reverse are the same line: the first axis the ends differ on orders them
+	diff = q[:,d:] - q[:,:d]
+	swap = diff[np.arange(len(q)), np.argmax(diff != 0, axis=1)] < 0
+	q[swap] = q[swap][:,list(range(d, 2*d)) + list(range(d))]
+	if (len(q) > 0):
+		# np.unique(q, axis=0), sorting by the columns is much faster
+		q = q[np.lexsort(q.T[::-1])]
+		keep = np.ones(len(q), bool)
+		keep[1:] = (q[1:] != q[:-1]).any(axis=1)
+		q = q[keep]
+	return (q + 0.5) * size
+
+def arc_sweeps(start, end, center, style, plane):
+	"""
+	Angles and radii of arcs.
+	
+	@parameters:
+	(N,3) arrays of start, end and center points
+	(N,) arrays of styles (2 cw, 3 ccw) and planes (0 XY, 1 ZX, 2 YZ)
+	
+	@return:
+	(N,) arrays of the start angles, sweeps (negative clockwise, a full
+	circle if the ends meet) and radii, in the plane of each arc
+	
+	"""
+	rows = np.arange(len(start))
+	axes = np.array(_PLANE_AXES)[plane]
+	a = axes[:,0]
+	b = axes[:,1]
+	sa = start[rows,a] - center[rows,a]
+	sb = start[rows,b] - center[rows,b]
+	a0 = np.arctan2(sb, sa)
+	a1 = np.arctan2(end[rows,b] - center[rows,b], end[rows,a] - center[rows,a])
+	# counter-clockwise sweep in (0, 2pi], a full circle if the ends meet
+	sweep = np.mod(a1 - a0, 2*pi)
+	sweep[sweep <= 1e-9] = 2*pi
+	cw = style == 2
+	sweep[cw] -= 2*pi
+	sweep[cw & (sweep > -1e-9)] = -2*pi
+	return a0, sweep, np.hypot(sa, sb)
+
+def arc_pieces(radius, sweep, tolerance):
+	"""
+	Number of lines to cut arcs into.
+	
+	@parameters:
+	(N,) arrays of radii and sweeps (radians), see arc_sweeps
+	chord error allowed, the largest distance between an arc and its
+	lines (units of the radii)
+	
+	@return:
+	(N,) array of the fewest lines keeping each arc within the chord
+	error, from 1 to _ARC_PIECES_MAX
+	
+	"""
+	# a chord of angle step strays r * (1 - cos(step/2)) from the arc
+	step = 2.0 * np.arccos(np.clip(1.0 - tolerance / np.maximum(radius, 1e-12), -1.0, 1.0))
+	return np.clip(np.ceil(np.abs(sweep) / np.maximum(step, 1e-9)), 1, _ARC_PIECES_MAX).astype(np.int64)
+
+def arc_tessellate(start, end, center, style, plane, pieces):
+	"""
+	Arcs to lines.
+	
+	Cut helical arcs into straight pieces, all arcs and planes at once.
+	The height along the helix axis changes linearly with the angle.
+	
+	@parameters:
+	(N,3) arrays of start, end and center points
+	(N,) arrays of styles (2 cw, 3 ccw) and planes (0 XY, 1 ZX, 2 YZ)
+	number of pieces, the same for every arc, or an (N,) array of the
+	pieces of each arc (see arc_pieces)
+	
+	@return:
+	(M,3) arrays of the start and end points of the pieces, the pieces
+	of each arc in a row from its start to its end
+	
+	"""
+	start = np.asarray(start, np.float64)
+	end = np.asarray(end, np.float64)
+	center = np.asarray(center, np.float64)
+	a0, sweep, r = arc_sweeps(start, end, center, style, plane)
+	pieces = np.zeros(len(start), np.int64) + pieces
+	n = pieces + 1 # points per arc
+	arc = np.repeat(np.arange(len(start)), n)
+	t = (np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n)) / pieces[arc].astype(np.float64)
+	ang = a0[arc] + sweep[arc] * t
+
+	axes = np.array(_PLANE_AXES)[plane][arc]
+	a = axes[:,0]
+	b = axes[:,1]
+	w = 3 - a - b # axis normal to the plane, the helix axis
+	rows = np.arange(len(arc))
+	points = np.empty((len(arc), 3))
+	points[rows,a] = center[arc,a] + r[arc] * np.cos(ang)
+	points[rows,b] = center[arc,b] + r[arc] * np.sin(ang)
+	points[rows,w] = start[arc,w] + (end[arc,w] - start[arc,w]) * t
+
+	last = np.cumsum(n) - 1
+	first = np.ones(len(arc), bool)
+	first[last] = False # points starting a piece
+	after = np.ones(len(arc), bool)
+	after[last - pieces] = False # points ending one
+	return points[first], points[after]
+
+def view_lines(seg, view, angles=None, tolerance=None, transform=None):
+	"""
+	Project SEGMENTS onto a view plane.
+	
+	@parameters:
+	SEGMENTS
+	view plane and rotation angles, see project_lines
+	chord error of the lines arcs are cut into (see arc_pieces), None
+	to leave the arcs out
+	transform of the moves, see project_lines
+	
+	@return:
+	list of (kind, lines): kind 0 for the rapid and 1 for the feed moves
+	(arcs cut into lines), lines the (N,4) array of their view plane
+	lines; kinds without moves are left out
+	
+	"""
+	rapid = seg.style == 0
+	feed = seg.style == 1
+	arc = seg.style >= 2
+	parts = [project_lines(seg.start[feed], seg.end[feed], view, angles, transform)]
+	if (tolerance is not None and arc.any()):
+		parts.append(project_arcs(seg.start[arc], seg.end[arc], seg.center[arc],
+			seg.style[arc], seg.plane[arc], view, tolerance, angles, transform))
+	kinds = []
+	for kind, lines in ((0, project_lines(seg.start[rapid], seg.end[rapid], view, angles, transform)),
+			(1, np.concatenate(parts))):
+		if (len(lines) > 0):
+			kinds.append((kind, lines))
+	return kinds
+
+def project_arcs(start, end, center, style, plane, view, tolerance, angles=None, transform=None):
+	"""
+	Cut arcs into lines within a chord error and project them onto a view
+	plane.
+	
+	The chord error is kept in space, the projection of the XY, XZ and
+	YZ views doesn't make it larger; that of the XYZ view may, by a
+	quarter at most.
+	
+	@parameters:
+	arcs, see arc_tessellate
+	view plane, see project_lines
+	chord error allowed (units, after the transform)
+	rotation angles of the XYZ view and transform, see project_lines
+	
+	@return:
+	(M,4) array of view plane lines
+	
+	"""
+	if (transform is not None):
+		tolerance /= abs(np.linalg.det(transform[:,:3])) ** (1.0/3) # the unit scale
+	a0, sweep, r = arc_sweeps(start, end, center, style, plane)
+	p1, p2 = arc_tessellate(start, end, center, style, plane, arc_pieces(r, sweep, tolerance))
+	return project_lines(p1, p2, view, angles, transform)
+
+def axis_lines(view, angles=None):
+	"""
+	The coordinate axis drawn at the origin, as Paint.DrawAxis.
+	
+	@return:
+	(N,4) array of lines x1,y1,x2,y2 in pixels from the origin, y down
+	
+	"""
+	axes = ((0,1), (0,2), (1,2), (0,1,2))[view]
+	ends = np.eye(3)[list(axes)] * _AXIS_LENGTH
+	lines = project_lines(np.zeros_like(ends), ends, view, angles)
+	lines[:,1::2] *= -1
+	return lines
+
+def fit_view(box, width, height, margin=8):
+	"""
+	Scale and position of a view plane box fitted into an image.
+	
+	@parameters:
+	(u0, v0, u1, v1) view plane box
+	image width and height, margin around the box (pixels)
+	
+	@return:
+	(scale, x, y): pixels per unit, and the pixel of the origin; a view
+	plane point u,v is drawn at x + u*scale, y - v*scale
+	
+	"""
+	u0, v0, u1, v1 = box
+	scale = min((width - 2*margin) / max(u1 - u0, 1e-9), (height - 2*margin) / max(v1 - v0, 1e-9))
+	scale = max(scale, 1e-9)
+	return scale, width/2.0 - scale*(u0 + u1)/2.0, height/2.0 + scale*(v0 + v1)/2.0
+
+def render_view(patterns, view, width, height, angles=None, move_colour=_MOVE_COLOUR):
+	"""
+	Project files onto a view plane, fitted into an image.
+	
+	Arcs are cut into lines within _ARC_TOLERANCE pixels of them. The
+	moves, arcs included, are fitted into the image with a margin and
+	grouped by pen as Paint.DrawSegments does: the rapid moves of all
+	files share a dashed pen, the feed moves of a file get a pen of its
+	colour. The lines are snapped to the pixel centers (at whole numbers),
+	which drops the many moves that fall into the same pixels of a
+	thumbnail.
+	
+	@parameters:
+	list of (colour, SEGMENTS, transform) of the files, transform as
+	for project_lines
+	view plane, see project_lines
+	image width and height (pixels)
+	rotation angles of the XYZ view, see project_lines
+	colour of the rapid moves
+	
+	@return:
+	list of ((colour, pen width, dashes), lines) in drawing order, lines
+	the (N,4) array of the pixel lines x1,y1,x2,y2 drawn with the pen
+	
+	"""
+	# arcs are cut for the scale fitting their end points, which is not
+	# smaller than the one fitting the lines cut from them
+	bounds = np.zeros((2,3))
+	for colour, seg, transform in patterns:
+		bounds = merge_bounds(bounds, transform_bounds(seg.bounds, transform))
+	scale = fit_view(project_bounds(bounds[None], view, angles)[0].tolist(), width, height)[0]
+
+	projected = []
+	lo = hi = np.zeros(2) # the axis is drawn at the origin
+	for colour, seg, transform in patterns:
+		for kind, lines in view_lines(seg, view, angles, _ARC_TOLERANCE / scale, transform):
+			lo = np.minimum(lo, np.minimum(lines[:,0:2].min(axis=0), lines[:,2:4].min(axis=0)))
+			hi = np.maximum(hi, np.maximum(lines[:,0:2].max(axis=0), lines[:,2:4].max(axis=0)))
+			projected.append((colour, kind, lines))
+	scale, x, y = fit_view(np.concatenate((lo, hi)).tolist(), width, height)
+
+	groups = {} # pen -> list of pixel line arrays
+	for colour, kind, lines in projected:
+		lines *= (scale, -scale, scale, -scale)
+		lines += (x, y) * 2
+		if (kind == 0):
+			pen = (move_colour, 1, _RAPID_DASHES)
+		else:
+			pen = (colour, 1, None)
+		groups.setdefault(pen, []).append(snap_lines(lines + 0.5, 1.0) - 0.5)
+
+	pens = [(('BLACK', 2, None), axis_lines(view, angles) + (x, y) * 2)]
+	for pen in sorted(groups, key=lambda pen: pen[2] is None):	# rapid moves below
+		pens.append((pen, np.concatenate(groups[pen])))
+	return pens
+
+def colour_rgb(colour):
+	"""(red, green, blue) of a colour name (see _COLOURS) or '#rrggbb'."""
+	if colour.startswith('#'):
+		return tuple(int(colour[i:i+2], 16) for i in (1, 3, 5))
+	return _COLOURS[colour.strip().upper()]
+
+def clip_lines(lines, x0, y0, x1, y1):
+	"""
+	Clip lines to a rectangle (Liang-Barsky, all lines at once).
+	
+	@parameters:
+	(N,4) array of lines x1,y1,x2,y2
+	rectangle
+	
+	@return:
+	(index, t0, t1): the indices of the lines meeting the rectangle, and
+	the part of each inside it, from t0 to t1 along the line (0 at its
+	start, 1 at its end)
+	
+	"""
+	lines = np.asarray(lines, np.float64)
+	d = lines[:,2:4] - lines[:,0:2]
+	t0 = np.zeros(len(lines))
+	t1 = np.ones(len(lines))
+	keep = np.ones(len(lines), bool)
+	for p, q in ((-d[:,0], lines[:,0] - x0), (d[:,0], x1 - lines[:,0]),
+			(-d[:,1], lines[:,1] - y0), (d[:,1], y1 - lines[:,1])):
+		keep &= (p != 0) | (q >= 0)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			r = q / p
+		t0 = np.where(p < 0, np.maximum(t0, r), t0)
+		t1 = np.where(p > 0, np.minimum(t1, r), t1)
+	keep &= t0 <= t1
+	return np.flatnonzero(keep), t0[keep], t1[keep]
+
+def draw_lines(image, lines, colour, width=1, dashes=None):
+	"""
+	Draw lines into an image.
+	
+	Each line is sampled at one point per pixel along its longer axis,
+	the samples are rounded to pixels, so lines are drawn without gaps
+	(and without anti-aliasing), in passes of at most _RASTER_BATCH
+	samples. Only the samples of the part of a line inside the image are
+	taken, but at the places they have on the whole line: a line drawn
+	across several tiles of an image gets the same pixels and dashes as
+	when drawn at once.
+	
+	@parameters:
+	(height, width, 3) RGB or (height, width, 4) RGBA uint8 image
+	(N,4) array of lines x1,y1,x2,y2, pixel centers are at whole numbers
+	colour, a tuple of a value per channel of the image
+	pen width (pixels)
+	dash pattern, pixels on and off, restarting at each line, or None
+	
+	"""
+	h, w = image.shape[:2]
+	lines = np.asarray(lines, np.float64)
+	index, t0, t1 = clip_lines(lines, -0.5 - width, -0.5 - width, w - 0.5 + width, h - 0.5 + width)
+	if (len(index) == 0):
+		return
+	lines = lines[index]
+	d = lines[:,2:4] - lines[:,0:2]
+	spans = np.maximum(np.ceil(np.abs(d).max(axis=1)), 1.0) # sample k of a line is at k / span
+	lengths = np.hypot(d[:,0], d[:,1])
+	starts = np.floor(t0 * spans)
+	steps = (np.ceil(t1 * spans) - starts).astype(np.int64) + 1
+	ends = np.cumsum(steps)
+	if dashes:
+		edges = np.cumsum(dashes)
+	brush = range(-((width - 1) // 2), width // 2 + 1)
+	colour = np.array(colour, np.uint8)
+
+	first = 0
+	while first < len(lines):
+		last = max(int(np.searchsorted(ends, ends[first] - steps[first] + _RASTER_BATCH, 'right')), first + 1)
+		n = steps[first:last]
+		line = np.repeat(np.arange(first, last), n)
+		k = np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n)
+		t = (starts[line] + k) / spans[line]
+		x = lines[line,0] + d[line,0] * t
+		y = lines[line,1] + d[line,1] * t
+		if dashes:
+			on = np.searchsorted(edges, np.mod(t * lengths[line], edges[-1]), 'right') % 2 == 0
+			x = x[on]
+			y = y[on]
+		xi = np.floor(x + 0.5).astype(np.int64) # rint would round halves apart, leaving gaps
+		yi = np.floor(y + 0.5).astype(np.int64)
+		for dx in brush:
+			for dy in brush:
+				px = xi + dx
+				py = yi + dy
+				inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+				image[py[inside], px[inside]] = colour
+		first = last
+
+def rasterize(pens, width, height, background=_BACKGROUND, pool=None):
+	"""
+	Draw lines into a new RGBA image with the NumPy rasterizer.
+	
+	With a pool the image is cut into tiles of _RASTER_TILE pixels, drawn
+	by the workers: each tile only gets the lines whose bounding box
+	touches it, so a worker draws just its share of the lines. Dashes
+	are laid out from the start of each line and so carry on across the
+	tiles. Without a pool the image is drawn as a single tile.
+	
+	@parameters:
+	pens and lines, see render_view
+	image width and height (pixels)
+	background colour, see colour_rgb
+	multiprocessing.Pool, or None to draw in this process
+	
+	@return:
+	(height, width, 4) uint8 RGBA image
+	
+	"""
+	size = _RASTER_TILE if pool else max(width, height, 1)
+	boxes = []
+	for (colour, pen_width, dashes), lines in pens:
+		lines = np.asarray(lines, np.float64)
+		boxes.append(((colour_rgb(colour) + (255,), pen_width, dashes), lines,
+			np.minimum(lines[:,0], lines[:,2]), np.minimum(lines[:,1], lines[:,3]),
+			np.maximum(lines[:,0], lines[:,2]), np.maximum(lines[:,1], lines[:,3])))
+	fill = colour_rgb(background) + (255,)
+
+	jobs = []
+	for y in xrange(0, height, size):
+		for x in xrange(0, width, size):
+			w = min(size, width - x)
+			h = min(size, height - y)
+			tile = []
+			for pen, lines, x0, y0, x1, y1 in boxes:
+				grow = pen[1] # the pen width reaches over the tile edge
+				hit = (x1 >= x - grow) & (x0 <= x + w + grow) & (y1 >= y - grow) & (y0 <= y + h + grow)
+				if hit.any():
+					tile.append((pen, lines[hit] - (x, y, x, y)))
+			jobs.append((x, y, w, h, fill, tile))
+
+	image = np.empty((height, width, 4), np.uint8)
+	if pool:
+		tiles = pool.imap_unordered(_raster_tile_job, jobs)
+	else:
+		tiles = itertools.imap(_raster_tile_job, jobs)
+	for x, y, tile in tiles:
+		image[y:y+tile.shape[0], x:x+tile.shape[1]] = tile
+	return image
+
+def _raster_tile_job(job):
+	"""rasterize() worker: draw the tile of job (x, y, width, height, background, pens)."""
+	x, y, w, h, fill, pens = job
+	tile = np.empty((h, w, 4), np.uint8)
+	tile[:] = fill
+	for (colour, pen_width, dashes), lines in pens:
+		draw_lines(tile, lines, colour, pen_width, dashes)
+	return x, y, tile
+
+def write_png(name, image):
+	"""Write an (height, width, 3) RGB or (height, width, 4) RGBA uint8 image to a PNG file."""
+	h, w, channels = image.shape
+	rows = np.zeros((h, 1 + w*channels), np.uint8) # filter type 0 (none) per row
+	rows[:,1:] = image.reshape(h, w*channels)
+
+	def chunk(kind, data):
+		return (struct.pack('>I', len(data)) + kind + data +
+			struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+	f = open(name, 'wb')
+	try:
+		f.write('\x89PNG\r\n\x1a\n')
+		f.write(chunk('IHDR', struct.pack('>IIBBBBB', w, h, 8, 6 if channels == 4 else 2, 0, 0, 0)))
+		f.write(chunk('IDAT', zlib.compress(rows.tostring(), 6)))
+		f.write(chunk('IEND', ''))
+	finally:
+		f.close()
+
+def write_svg(name, width, height, pens, background=_BACKGROUND):
+	"""
+	Write lines to an SVG file, one path per pen.
+	
+	@parameters:
+	file name
+	image width and height (pixels)
+	pens and lines, see render_view
+	background colour
+	
+	"""
+	f = open(name, 'w')
+	try:
+		f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+		f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n'
+			% (width, height, width, height))
+		f.write('<rect width="100%%" height="100%%" fill="#%02x%02x%02x"/>\n' % colour_rgb(background))
+		for (colour, pen_width, dashes), lines in pens:
+			if (len(lines) == 0):
+				continue
+			f.write('<path fill="none" stroke="#%02x%02x%02x" stroke-width="%d"' % (colour_rgb(colour) + (pen_width,)))
+			if dashes:
+				f.write(' stroke-dasharray="%s"' % ','.join(str(dash) for dash in dashes))
+			f.write(' d="')
+			for n in xrange(0, len(lines), 10000):
+				f.write(''.join('M%.1f %.1fL%.1f %.1f' % tuple(line) for line in lines[n:n+10000].tolist()))
+			f.write('"/>\n')
+		f.write('</svg>\n')
+	finally:
+		f.close()
+
+def render_image(name, patterns, view, width, height, angles=None, pool=None):
+	"""
+	Render files in a view plane to an image file, PNG or SVG after the
+	extension of its name.
+	
+	@parameters:
+	image file name
+	list of (colour, SEGMENTS, transform) of the files, see render_view
+	view plane, see project_lines
+	image width and height (pixels)
+	rotation angles of the XYZ view, see project_lines
+	multiprocessing.Pool drawing the tiles of a PNG, see rasterize
+	
+	"""
+	pens = render_view(patterns, view, width, height, angles)
+	if name.lower().endswith('.svg'):
+		write_svg(name, width, height, pens)
+	else:
+		write_png(name, rasterize(pens, width, height, pool=pool))
+
+def render_file(name, directory, views, width, height, kind='png', colour=_DEFAULT_COLOUR, transform=None,
+		cache=None, pool=None):
+	"""
+	Parse a G-code file and render its views to image files.
+	
+	The images are named after the file, the view and the kind:
+	part.ngc gives part.ngc.xy.png and so on.
+	
+	@parameters:
+	G-code or toolpath file name
+	directory of the images, None for the directory of the file
+	view planes, see project_lines
+	image width and height (pixels)
+	image kind, 'png' or 'svg'
+	colour of the feed moves
+	transform of the moves, see project_lines
+	PARSE_CACHE, see parse_gcode_file
+	multiprocessing.Pool drawing the tiles of the images, see rasterize
+	
+	@return:
+	(number of moves, parse time, render time) in seconds, raises
+	IOError if the file can't be read or an image can't be written
+	
+	"""
+	start = time.time()
+	segments = parse_gcode_file(name, cache=cache)
+	parsed = time.time()
+	if directory is None:
+		directory = os.path.dirname(name)
+	elif not os.path.isdir(directory):
+		try:
+			os.makedirs(directory)
+		except OSError:
+			if not os.path.isdir(directory): # not made by another worker
+				raise
+	for view in views:
+		image = os.path.join(directory, '%s.%s.%s' % (os.path.basename(name), _VIEW_NAMES[view], kind))
+		render_image(image, [(colour, segments, transform)], view, width, height, pool=pool)
+	return len(segments), parsed - start, time.time() - parsed
+
+def _render_file_job(job):
+	"""render_main() worker: render_file() of job (name, directory, ...), with the error caught."""
+	try:
+		return job[0], render_file(*job), None
+	except (IOError, OSError), error:
+		return job[0], None, str(error)
+
+def gcode_files(paths):
+	"""
+	Find the G-code and toolpath files to render.
+	
+	@parameters:
+	list of file and directory names
+	
+	@return:
+	generator of (file name, directory of the file relative to the
+	directory given, '' for files given)
+	
+	"""
+	suffixes = tuple(suffix + compressed for suffix in _GCODE_SUFFIXES for compressed in _COMPRESSED_SUFFIXES)
+	for path in paths:
+		if not os.path.isdir(path):
+			yield path, ''
+			continue
+		for directory, subdirectories, names in os.walk(path):
+			subdirectories.sort()
+			relative = os.path.relpath(directory, path)
+			for name in sorted(names):
+				if name.lower().endswith(suffixes):
+					yield os.path.join(directory, name), ('' if relative == '.' else relative)
+
+def render_main(argv=None):
+	"""
+	Command line entry point of the headless renderer.
+	
+	Renders the views of G-code files to images in a pool of worker
+	processes, one file per worker at a time (a single file has the tiles
+	of its images drawn by the pool instead), and prints the parse and
+	render time of each file as it is done.
+	
+	@return:
+	exit status, 1 if any file failed
+	
+	"""
+	parser = argparse.ArgumentParser(description='Render G-code files to PNG or SVG images, without a display.')
+	parser.add_argument('paths', nargs='+', metavar='PATH',
+		help='G-code or toolpath file, or directory searched for them')
+	parser.add_argument('-o', '--output', metavar='DIR',
+		help='directory of the images, subdirectories mirror the directories searched '
+		'(default: next to each file)')
+	parser.add_argument('-v', '--views', default=','.join(_VIEW_NAMES),
+		help='comma separated views among %s (default: all)' % ', '.join(_VIEW_NAMES))
+	parser.add_argument('-s', '--size', default='256x256', help='image size WIDTHxHEIGHT (default: 256x256)')
+	parser.add_argument('-f', '--format', choices=('png', 'svg'), default='png', help='image format (default: png)')
+	parser.add_argument('-c', '--colour', default=_DEFAULT_COLOUR,
+		help='colour of the feed moves, a name or #rrggbb (default: %s)' % _DEFAULT_COLOUR)
+	parser.add_argument('-r', '--rotate', type=float, default=0.0,
+		help='rotation clockwise around the origin, in degrees (default: 0)')
+	parser.add_argument('--shift', default='0,0', metavar='X,Y', help='shift after the rotation (default: 0,0)')
+	parser.add_argument('--inch', action='store_true', help='the files are in inches, draw millimeters')
+	parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+		help='worker processes (default: one per CPU)')
+	parser.add_argument('--cache', action='store_true', help='use the parse cache of the viewer')
+	args = parser.parse_args(argv)
+
+	try:
+		views = [_VIEW_NAMES.index(view.strip().lower()) for view in args.views.split(',')]
+		width, height = [int(n) for n in args.size.lower().split('x')]
+		xshift, yshift = [float(n) for n in args.shift.split(',')]
+		colour_rgb(args.colour)
+	except (ValueError, KeyError):
+		parser.error('bad views, size, shift or colour')
+	transform = None
+	if (args.rotate or xshift or yshift or args.inch):
+		transform = transform_matrix(args.rotate * pi/180, xshift, yshift, 25.4 if args.inch else 1.0)
+	cache = PARSE_CACHE() if args.cache else None
+
+	jobs = []
+	for name, relative in gcode_files(args.paths):
+		directory = args.output and os.path.join(args.output, relative)
+		jobs.append((name, directory, views, width, height, args.format, args.colour, transform, cache))
+
+	start = time.time()
+	work = 0.0
+	failed = 0
+	processes = max(1, args.jobs if len(jobs) == 1 else min(args.jobs, len(jobs)))
+	pool = multiprocessing.Pool(processes) if processes > 1 else None
+	try:
+		if (len(jobs) == 1):	# a single file, its tiles drawn by the pool
+			results = [_render_file_job(jobs[0] + (pool,))]
+		elif pool:
+			results = pool.imap_unordered(_render_file_job, jobs)
+		else:
+			results = (_render_file_job(job) for job in jobs)
+		for name, result, error in results:
+			if error:
+				failed += 1
+				print "FAILED %s: %s" % (name, error)
+				continue
+			moves, parse_time, render_time = result
+			work += parse_time + render_time
+			print "%8.3f s  parse %7.3f s  render %7.3f s  %9d moves  %s" % (
+				parse_time + render_time, parse_time, render_time, moves, name)
+			sys.stdout.flush()
+	finally:
+		if pool:
+			pool.terminate()
+			pool.join()
+	print "%d files, %d failed, %.3f s (%.3f s of work on %d processes)" % (
+		len(jobs), failed, time.time() - start, work, processes)
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(render_main())
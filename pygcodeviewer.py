@@ -5,6 +5,9 @@ Simple G-Code viewer
 
 Dependencies:
 wxPython (a Python wrapper for the wxWidgets platform GUI library)
+NumPy (parsed moves are kept in typed arrays)
+gcodeparser (the G-code parser, which doesn't need wxPython)
+gcoderender (the view projections, shared with the headless renderer)
 NB method naming conventions (initial capital) used here are cf wxPython
 
 wxPython Home http://wxpython.org/
@@ -12,27 +15,44 @@ wxPython API reference: http://wxpython.org/docs/api/
 
 """
 import wx
+import numpy as np
 from string import *
 from math import *
 import os
 import sys
 import locale
-import re
+import threading
+import multiprocessing
+import time
+import copy
+
+from gcodeparser import *
+from gcodeparser import _PARALLEL_BYTES, _TOOLPATH_BLOCK
+from gcoderender import *
+from gcoderender import _XYZ_ANGLES, _RAPID_DASHES
 
 # Globals
 gUNIT = 1 # TODO: implement millimeters/Inches
 gGCODES = []
 gPATTERNS = []
+gBOUNDS = np.zeros((2,3)) # [minima, maxima] of gPATTERNS, always holds the origin
 gMouseLeftDown  = [0]*3
 gMouseRightDown = [0]*3
 
 gRotation_Angle = 0
 gSHIFT_X = 0
 gSHIFT_Y = 0
+gCACHE = None # PARSE_CACHE of the parsed files, set up by main()
+
 # Window
 class MainFrame(wx.Frame):
 
 	_paint = None # the panel used for drawing
+	_loader = None # the running LoadThread
+	_progress = None # its progress dialog
+	_stream = None # the running StreamThread
+	_watch_interval = 500 # milliseconds between two looks at the watched files
+	_watch_settle = 1.0 # seconds a changed file must stay unchanged before it is reloaded
 
 	def __init__(self, parent, id, title):
 		wx.Frame.__init__(self, parent, id, title, size=(800, 600))
@@ -41,17 +61,34 @@ class MainFrame(wx.Frame):
 		filemenu= wx.Menu()
 		menuOpen = filemenu.Append(wx.ID_OPEN,"&Open"," Open files")
 		menuReload = filemenu.Append(wx.ID_REVERT,"&Reload"," Reload files")
+		menuStream = filemenu.Append(wx.ID_ANY,"Open &stream..."," Show G-code as it is streamed")
+		menuWatch = filemenu.AppendCheckItem(wx.ID_ANY,"&Watch files"," Reload files when they change")
+		menuExport = filemenu.Append(wx.ID_ANY,"&Export toolpath..."," Save the loaded files as toolpath files")
 		menuExit = filemenu.Append(wx.ID_EXIT,"E&xit"," Terminate the program")
 
+		viewmenu= wx.Menu()
+		menuSoftware = viewmenu.AppendCheckItem(wx.ID_ANY,"&Software rendering"," Draw with NumPy on all processors")
+
 		# Create the menubar
 		menuBar = wx.MenuBar()
 		menuBar.Append(filemenu,"&File")
+		menuBar.Append(viewmenu,"&View")
 		self.SetMenuBar(menuBar)
 
 		# Menu bar events
 		self.Bind(wx.EVT_MENU, self.OnOpen, menuOpen)
 		self.Bind(wx.EVT_MENU, self.OnReload, menuReload)
+		self.Bind(wx.EVT_MENU, self.OnStream, menuStream)
+		self.Bind(wx.EVT_MENU, self.OnWatch, menuWatch)
+		self.Bind(wx.EVT_MENU, self.OnExport, menuExport)
 		self.Bind(wx.EVT_MENU, self.OnExit, menuExit)
+		self.Bind(wx.EVT_MENU, self.OnSoftware, menuSoftware)
+
+		# File watch mode
+		self._watch = wx.Timer(self)
+		self._watched = {} # GCODE -> (size, mtime, time first seen)
+		self._dirty = set() # PATTERNs changed since the last redraw
+		self.Bind(wx.EVT_TIMER, self.OnWatchTimer, self._watch)
 
 		panel = wx.Panel(self, -1)
 		vbox = wx.BoxSizer(wx.VERTICAL)
@@ -96,18 +133,232 @@ class MainFrame(wx.Frame):
 	# Functions
 	def EvtRadioBox1(self,e):
 		self._paint.view_point = e.GetInt()
-		self.Refresh(True)
+		self._paint.Redraw()
 
 	def OnExit(self,e):
 		self.Close(True)  # Close the frame.
 
+	def OnSoftware(self,e):
+		"""Switch between drawing with wxPython and the NumPy rasterizer."""
+		self._paint.software = e.IsChecked()
+
 	def OnOpen(self,e):
 		setup = OpenFiles(None, -1, 'Open Files')
+		gcodes = setup.load
+		transformed = setup.transformed
+		cleared = setup.cleared
 		setup.Destroy()
-		self.Refresh(True)
+		if (self._loader and (gcodes or
+				[gcode for gcode in self._loader.gcodes + self._loader.tails if gcode not in gGCODES])):
+			self.CancelLoad() # replaced by the new load, or the files were cleared
+		if (self._stream and self._stream.gcodes not in gGCODES):
+			self.StopStream() # the files were cleared
+		if transformed:
+			self.SetTransform(transformed, file_transform())
+		if cleared:
+			self._paint.invalidate() # nothing left to keep
+		if gcodes:
+			self.StartLoad(gcodes)
 
 	def OnReload(self,e):
-		parseGCodeFile()
+		self.CancelLoad()
+		self.StartLoad(gGCODES)
+
+	def OnStream(self,e):
+		dlg = wx.TextEntryDialog(self, "G-code stream: - (standard input), a named pipe,\n"
+			"tcp:HOST:PORT or unix:PATH (sockets to connect to)", "Open stream", "-")
+		if (dlg.ShowModal() == wx.ID_OK and dlg.GetValue()):
+			self.StartStream(dlg.GetValue())
+		dlg.Destroy()
+
+	def StartStream(self, source, colour=None):
+		"""Show the G-code of a live stream, see StreamThread."""
+		self.StopStream()
+		gcodes = GCODE(source, colour or OpenFiles._default_colour, file_transform())
+		gGCODES.append(gcodes)
+		self._stream = StreamThread(self, gcodes)
+		self._redraw_time = time.time()
+		self._stream.start()
+
+	def StopStream(self):
+		"""Stop reading the live stream, the moves read so far are kept."""
+		if self._stream:
+			self._stream.cancel()
+			self.OnLoadDone(self._stream)
+
+	def OnExport(self,e):
+		"""Save the loaded files as toolpath files, see read_toolpath."""
+		dlg = wx.DirDialog(self, "Choose a directory for the toolpath files")
+		if (dlg.ShowModal() == wx.ID_OK):
+			for gcodes in gGCODES:
+				if (gcodes.pattern is None or gcodes.modal is None):
+					continue # not loaded
+				name = os.path.join(dlg.GetPath(), os.path.splitext(os.path.basename(gcodes.name))[0] + '.gtp')
+				segments = gcodes.pattern.segments
+				if (gcodes.matrix() is not None):
+					segments = segments.transformed(gcodes.matrix()) # as drawn
+				try:
+					write_toolpath(name, segments, {'name': gcodes.name, 'modal': vars(gcodes.modal)})
+				except (IOError, OSError):
+					error_dialog("Unable to write the file" + name + "\n", False)
+		dlg.Destroy()
+
+	def OnWatch(self,e):
+		if e.IsChecked():
+			self._watched = {}
+			self._watch.Start(self._watch_interval)
+		else:
+			self._watch.Stop()
+
+	def OnWatchTimer(self,e):
+		"""
+		Look at the watched files, reload those that changed once they
+		stay unchanged for _watch_settle seconds, so that a burst of writes
+		is reloaded once.
+		
+		"""
+		if self._loader:
+			return # look again when it is done
+		now = time.time()
+		changed = []
+		for gcodes in gGCODES:
+			stat = file_stat(gcodes.name)
+			if (stat is None or gcodes.parsed is None):
+				continue # not loaded, the user reloads it
+			stamp = (stat.st_size, stat.st_mtime)
+			if (stamp == gcodes.parsed[:2]):
+				self._watched.pop(gcodes, None)
+				continue
+			seen = self._watched.get(gcodes)
+			if (seen is None or seen[:2] != stamp):
+				self._watched[gcodes] = stamp + (now,) # still being written
+			elif (now - seen[2] >= self._watch_settle):
+				changed.append(gcodes)
+		if changed:
+			for gcodes in changed:
+				del self._watched[gcodes]
+			self.StartLoad(changed, False)
+
+	def StartLoad(self, gcodes, progress=True):
+		"""
+		Parse the changed G-code files in a LoadThread.
+		
+		@parameters:
+		list of GCODEs
+		False to load without showing a progress dialog
+		
+		"""
+		loader = LoadThread(self, gcodes)
+		if not (loader.gcodes or loader.tails):
+			return # all up to date
+		self._loader = loader
+		if progress:
+			self._progress = wx.ProgressDialog('Loading', 'Parsing G-code', maximum=1000, parent=self,
+				style=wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+		self._redraw_time = time.time()
+		self._loader.start()
+
+	def CancelLoad(self):
+		"""Stop the running load, the files parsed so far are kept."""
+		if self._loader:
+			self._loader.cancel()
+			self.OnLoadDone(self._loader)
+
+	def SetTransform(self, gcodes, transform):
+		"""
+		Move loaded files without parsing them again: only their drawing,
+		and the overall bounds, are made again.
+		
+		@parameters:
+		list of GCODEs
+		(rot_ang, xshift, yshift, unit), see GCODE
+		
+		"""
+		global gBOUNDS
+		patterns = set()
+		for gcode in gcodes:
+			gcode.transform = transform
+			for pattern in gcode.patterns:
+				pattern.transform = gcode.matrix()
+				patterns.add(pattern)
+		gBOUNDS = np.zeros((2,3))
+		for pattern in gPATTERNS:
+			gBOUNDS = merge_bounds(gBOUNDS, transform_bounds(pattern.segments.bounds, pattern.transform))
+		self._paint.invalidate(patterns)
+
+	def OnLoadFile(self, loader, gcodes, pattern, replace=True):
+		"""
+		A LoadThread starts parsing a file into pattern, which takes the
+		place of the file's old pattern, or is added after it.
+		
+		"""
+		global gPATTERNS
+		if (loader is not self._loader and loader is not self._stream):
+			return
+		gcodes.modal = None # until the load is finished
+		old = gcodes.pattern if replace else None
+		if (old is not None and old in gPATTERNS):
+			gPATTERNS[gPATTERNS.index(old)] = pattern
+		else:
+			gPATTERNS.append(pattern)
+		gcodes.patterns = [other for other in gcodes.patterns if other is not old and other is not pattern] + [pattern]
+		gcodes.pattern = pattern
+
+	def OnLoadState(self, loader, gcodes, modal, parsed):
+		"""A LoadThread finished a file, see GCODE.changes()."""
+		if (loader is self._loader):
+			gcodes.modal = modal
+			gcodes.parsed = parsed
+
+	def OnLoadChunk(self, loader, pattern, chunk, nbytes, message):
+		"""
+		A LoadThread (or StreamThread) parsed the next chunk of moves of
+		pattern. Redraws are throttled to one per loader.redraw_interval.
+		
+		@parameters:
+		the LoadThread
+		the PATTERN of the file
+		SEGMENTS of the chunk
+		bytes parsed so far
+		progress message
+		
+		"""
+		global gBOUNDS
+		if (loader is not self._loader and loader is not self._stream):
+			return
+		pattern.segments.extend(chunk)
+		gBOUNDS = merge_bounds(gBOUNDS, transform_bounds(chunk.bounds, pattern.transform))
+		self._dirty.add(pattern)
+		if (time.time() - self._redraw_time > loader.redraw_interval):
+			self._paint.invalidate(self._dirty)
+			self._dirty = set()
+			self._redraw_time = time.time()
+		if (loader is not self._loader or not self._progress):
+			return
+		cont = self._progress.Update(min(999, 1000 * nbytes / max(loader.total_bytes, 1)), message)
+		if isinstance(cont, tuple):
+			cont = cont[0]
+		if not cont:
+			self.CancelLoad()
+
+	def OnLoadDone(self, loader):
+		"""A LoadThread (or StreamThread) finished, or was cancelled."""
+		global gBOUNDS
+		if (loader is self._stream):
+			self._stream = None
+		elif (loader is self._loader):
+			self._loader = None
+			if self._progress:
+				self._progress.Destroy()
+				self._progress = None
+		else:
+			return
+		gBOUNDS = np.zeros((2,3)) # replaced patterns may have been bigger
+		for pattern in gPATTERNS:
+			pattern.segments.trim()
+			gBOUNDS = merge_bounds(gBOUNDS, transform_bounds(pattern.segments.bounds, pattern.transform))
+		self._paint.invalidate(self._dirty)
+		self._dirty = set()
 		
 		
 class Paint(wx.ScrolledWindow):
@@ -167,20 +418,20 @@ class Paint(wx.ScrolledWindow):
 	_mag_MIN = 0.1
 	_mag_MAX = 500.0
 	
-	# minimum/maximum coordinate values
-	_minX = 0.0
-	_maxX = 0.0
-	_minY = 0.0
-	_maxY = 0.0
-	_minZ = 0.0
-	_maxZ = 0.0
-
 	_scale = 1.0
 	_scale_min = 0.1
 	_scale_max = 500.0
 	_view_point = 0
+	_angles = _XYZ_ANGLES # rotation angles of the XYZ view, see view_matrix
+	_orbit_rate = pi/400 # radians the XYZ view turns per pixel dragged
+	_orbiting = False # drawing the orbit level of detail, see OnPaint
+	_orbit_until = 0.0 # time the orbit level of detail is drawn until
 	
 	_move_colour = 'BLUE' # G-code moves colour
+	_software = False # draw with the NumPy rasterizer, see RasterBitmap
+	_frame_interval = 1.0/30 # seconds between two repaints, at least
+	_settle = 0.2 # seconds zooming must pause before the paths are rendered again
+	_arc_tolerance = 0.25 # chord error of the lines drawn for an arc (pixels)
 
 	# True for debugging messages (in the scroll wheel handling method)
 	_debug = False
@@ -191,16 +442,23 @@ class Paint(wx.ScrolledWindow):
 		wx.ScrolledWindow.__init__(self, parent,-1,style=wx.HSCROLL|wx.VSCROLL)
 		self.SetBackgroundColour('WHITE')
 
-		self._maxX = 0.0
-		self._minX = 0.0
-		self._maxY = 0.0
-		self._minY = 0.0
-		self._maxZ = 0.0
-		self._minZ = 0.0		
+		self._pens = {}
+		self._bitmap = None # backing bitmap, see OnPaint
+		self._bitmap_key = None
+		self._layers = {} # (PATTERN, view key[, block]) -> projected layers, see GetLayers
+		self._orbit_from = None # last mouse position of an orbit of the XYZ view
+		self._drawn = set() # keys of the block layers drawn last
+		self._pool = None # worker processes of the rasterizer
+		self._last_paint = 0.0 # time of the last repaint, see Redraw
+		self._preview_until = 0.0 # show previews until then, see OnPaint
+		self._redraw_at = 0.0 # time the redraw timer goes off
+		self._redraw_timer = wx.Timer(self)
+		self.Bind(wx.EVT_TIMER, self.OnRedrawTimer, self._redraw_timer)
 
 		self.SetScrollbars(10, 10, 100, 100);
 
 		self.Bind(wx.EVT_PAINT, self.OnPaint)		
+		self.Bind(wx.EVT_ERASE_BACKGROUND, self.OnEraseBackground)
 		self.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
 		self.Bind(wx.EVT_PAINT, self.OnPaint)
 
@@ -228,23 +486,24 @@ class Paint(wx.ScrolledWindow):
 		self.Centre()
 		self.Show(True)
 
+	# minimum/maximum coordinate values, kept up to date by the parser
 	@property
-	def maxX(self): return self._maxX
+	def maxX(self): return float(gBOUNDS[1,0])
 
 	@property
-	def maxY(self): return self._maxY
+	def maxY(self): return float(gBOUNDS[1,1])
 
 	@property
-	def maxZ(self): return self._maxZ
+	def maxZ(self): return float(gBOUNDS[1,2])
 
 	@property
-	def minX(self): return self._minX
+	def minX(self): return float(gBOUNDS[0,0])
 
 	@property
-	def minY(self): return self._minY
+	def minY(self): return float(gBOUNDS[0,1])
 
 	@property
-	def minZ(self): return self._minZ
+	def minZ(self): return float(gBOUNDS[0,2])
 
 	@property
 	def mag(self):
@@ -266,6 +525,42 @@ class Paint(wx.ScrolledWindow):
 		"""Set the point of view."""
 		self._view_point = value
 
+	@property
+	def angles(self):
+		"""Get the rotation angles (theta, phi, psi) of the XYZ view."""
+		return self._angles
+
+	@angles.setter
+	def angles(self, value):
+		"""Turn the XYZ view, the layers projected at other angles are dropped."""
+		self._angles = tuple(value)
+		for key in self._layers.keys():
+			if (isinstance(key[1], tuple) and key[1] != self.ViewKey()):
+				del self._layers[key]
+		self.Redraw()
+
+	def ViewKey(self):
+		"""The current view plane, with the angles of the XYZ view."""
+		if (self._view_point == 3):
+			return (3,) + self._angles
+		return self._view_point
+
+	@property
+	def software(self):
+		"""True when drawing with the NumPy rasterizer instead of wxPython."""
+		return self._software
+
+	@software.setter
+	def software(self, value):
+		"""Switch the NumPy rasterizer on or off."""
+		self._software = value
+		if (value and self._pool is None and multiprocessing.cpu_count() > 1):
+			self._pool = multiprocessing.Pool()
+		elif (not value and self._pool is not None):
+			self._pool.terminate()
+			self._pool = None
+		self.Redraw()
+
 	def OnAppMouseWheel(self, event):
 		"""
 		Watch all app mousewheel events, looking for ones from descendants.
@@ -328,31 +623,131 @@ class Paint(wx.ScrolledWindow):
 		"""
 		Draw the Gerber G-Code path
 		
+		The paths are rendered once into a backing bitmap that covers the
+		whole scrollable area; repaints only blit it at the scroll offset.
+		The bitmap is rendered again when the data (see invalidate()),
+		view plane, scale, window size or colours change. While zooming
+		(see Redraw) the last bitmap is shown scaled instead, and the
+		paths are only rendered again once the zooming pauses. While the
+		XYZ view is orbited (see OnMouseMove) the paths are rendered from
+		their orbit level of detail (see ORBIT_LAYER), and whole once the
+		orbiting pauses.
+		
 		"""
-		global gPATTERNS
-
 		dc = wx.PaintDC(self) # graphics device context
+		self._last_paint = time.time()
+		self._orbiting = self._view_point == 3 and self._last_paint < self._orbit_until
+
+		key = self.RenderKey()
+		if (self._bitmap is None or key != self._bitmap_key):
+			if (self._last_paint < self._preview_until and self._bitmap is not None and
+					key[:1] + key[2:] == self._bitmap_key[:1] + self._bitmap_key[2:]):
+				self.DrawPreview(dc, key[1] / self._bitmap_key[1])
+				self.ScheduleRedraw(self._preview_until)
+				return
+			self.RenderBitmap()
+			self._bitmap_key = key
+			if self._orbiting:
+				self.ScheduleRedraw(self._orbit_until)
 
 		view_offset = self.CalcUnscrolledPosition(0,0) # translate scrolled and unscrolled
+		dc.DrawBitmap(self._bitmap, -view_offset[0], -view_offset[1])
 
-		if ( len(gPATTERNS ) > 0):
-			# update coordinates minima/maxima
-			# for now we get rid of the global MIN/MAX variables this way			
-			for patterns in gPATTERNS:
-				for pattern in patterns.patterns:
-					for point in pattern.points:
-						if (point.x > self._maxX): self._maxX = point.x
-						if (point.x < self._minX): self._minX = point.x
-						if (point.y > self._maxY): self._maxY = point.y
-						if (point.y < self._minY): self._minY = point.y
-						if (point.z > self._maxZ): self._maxZ = point.z
-						if (point.z < self._minZ): self._minZ = point.z
+	def DrawPreview(self, dc, ratio):
+		"""
+		Draw the backing bitmap scaled by ratio about the drawing center,
+		a quick stand-in for the bitmap at a new scale.
+		
+		"""
+		view_offset = self.CalcUnscrolledPosition(0,0)
+		if (ratio < 1.0):
+			dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+			dc.Clear()
+		dc.SetUserScale(ratio, ratio)
+		dc.DrawBitmap(self._bitmap, (self._center.x * (1.0 - ratio) - view_offset[0]) / ratio,
+			(self._center.y * (1.0 - ratio) - view_offset[1]) / ratio)
+		dc.SetUserScale(1.0, 1.0)
+
+	def Redraw(self, preview=False):
+		"""
+		Ask for a repaint, the way all changes get to the screen.
+		
+		Requests are merged, and repaints come at most every
+		_frame_interval seconds: the first request after a quiet spell is
+		painted at once, the next ones wait for the redraw timer, which
+		paints them all in one go.
+		
+		@parameters:
+		True when the scale changes by user input, such as the mouse
+		wheel: until the input pauses for _settle seconds, repaints show a
+		scaled preview of the last bitmap (see OnPaint)
+		
+		"""
+		now = time.time()
+		if preview:
+			self._preview_until = now + self._settle
+		if (now >= self._last_paint + self._frame_interval and not self._redraw_timer.IsRunning()):
+			self.Refresh(False)
+		else:
+			self.ScheduleRedraw(self._last_paint + self._frame_interval)
+
+	def ScheduleRedraw(self, when):
+		"""Set the redraw timer to repaint at time when, unless it goes off before."""
+		if (self._redraw_timer.IsRunning() and self._redraw_at <= when):
+			return
+		self._redraw_at = when
+		self._redraw_timer.Start(max(1, int(ceil((when - time.time()) * 1000))), wx.TIMER_ONE_SHOT)
+
+	def OnRedrawTimer(self, e):
+		self.Refresh(False)
+
+	def OnEraseBackground(self, e):
+		"""The backing bitmap covers the window, no need to erase it."""
+		pass
+
+	def invalidate(self, patterns=None):
+		"""
+		Drop the backing bitmap and layers after the G-code data changed.
+		
+		@parameters:
+		PATTERNs whose moves changed, default all; the layers of the
+		others are kept, unless they are not in gPATTERNS any more
 		
+		"""
+		self._bitmap = None
+		if (patterns is None):
+			self._layers = {}
+		else:
+			for key in self._layers.keys():
+				if (key[0] in patterns or key[0] not in gPATTERNS):
+					del self._layers[key]
+		self.Redraw()
+
+	def RenderKey(self):
+		"""Everything, besides the data, the backing bitmap depends on."""
+		size = self.GetSize()
+		return (self._view_point, self._scale, size.x, size.y, self._move_colour, self._software,
+			tuple(patterns.colour for patterns in gPATTERNS), self._angles, self._orbiting)
+
+	def RenderBitmap(self):
+		"""Render all paths into the backing bitmap, in unscrolled coordinates."""
+		size = self.GetSize()
+		virtual = self.GetVirtualSize()
+
 		self._center = POINT( 
-		int( self.GetSize().x / 2 ) + (self.minX+self.maxX) / 2, 
-		int( self.GetSize().y / 2 ) + (self.minY+self.maxY) / 2, 
+		int( size.x / 2 ) + (self.minX+self.maxX) / 2, 
+		int( size.y / 2 ) + (self.minY+self.maxY) / 2, 
 		(self.minZ+self.maxZ) / 2 )
 
+		if self._software:
+			self.RasterBitmap(max(size.x, virtual.x), max(size.y, virtual.y))
+			return
+
+		self._bitmap = wx.EmptyBitmap(max(size.x, virtual.x), max(size.y, virtual.y))
+		dc = wx.MemoryDC(self._bitmap)
+		dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+		dc.Clear()
+
 		if self._debug:
 			dc.DrawRectangle( self._center.x-45*self._scale, self._center.y-30*self._scale, 90*self._scale, 60*self._scale)
 				
@@ -360,61 +755,166 @@ class Paint(wx.ScrolledWindow):
 
 			self.DrawAxis( dc )
 
-			# draw the G-code path points
-			for patterns in gPATTERNS:
-				for pattern in patterns.patterns:
-				
-					if (self._view_point==0):	#XY
-						p1x = pattern.points[0].x
-						p1y = pattern.points[0].y
-						p2x = pattern.points[1].x
-						p2y = pattern.points[1].y
-						
-					elif (self._view_point==1):	#XZ
-						p1x = pattern.points[0].x
-						p1y = pattern.points[0].z
-						p2x = pattern.points[1].x
-						p2y = pattern.points[1].z
-						
-					elif (self._view_point==2):	#YZ
-						p1x = pattern.points[0].y
-						p1y = pattern.points[0].z
-						p2x = pattern.points[1].y
-						p2y = pattern.points[1].z
-						
-					else:	#XYZ
-						p1,p2 = change_view(pattern.points[0], pattern.points[1])
-						p1x = p1.x
-						p1y = p1.y
-						p2x = p2.x
-						p2y = p2.y
-						
-					x1 =  p1x * self._scale + self._center.x - view_offset[0]
-					y1 = -p1y * self._scale + self._center.y - view_offset[1]
-					x2 =  p2x * self._scale + self._center.x - view_offset[0]
-					y2 = -p2y * self._scale + self._center.y - view_offset[1]
-
-					if (pattern.style == 0):	# rapid move
-						dc.SetPen(wx.Pen(self._move_colour, 1, wx.DOT_DASH))
-						dc.DrawLines(([x1,y1],[x2,y2]))
+			self.DrawSegments( dc, self._bitmap.GetWidth(), self._bitmap.GetHeight() )
 
-					if (pattern.style == 1):    # coordinated move
-						dc.SetPen(wx.Pen(patterns.colour, 1, wx.SOLID))
-						dc.DrawLines([[x1,y1],[x2,y2]])
+		dc.SelectObject(wx.NullBitmap)
 
-					if (pattern.style == 2 or pattern.style == 3):  # coordinated helical move
-						dc.SetPen(wx.Pen(patterns.colour, 1, wx.SOLID))
-						dc.DrawArcPoint(pattern.p1,pattern.p2,pattern.center)
+	def RasterBitmap(self, width, height):
+		"""
+		Render all paths into the backing bitmap with the NumPy rasterizer.
+		
+		The same lines as DrawAxis and DrawSegments are drawn into an RGBA
+		array by rasterize(), in tiles spread over the worker processes,
+		and the array becomes the bitmap in one go.
+		
+		"""
+		pens = []
+		if ( len(gPATTERNS ) > 0):
+			pens.append((('BLACK', 2, None), axis_lines(self._view_point, self._angles) + (self._center.x, self._center.y) * 2))
+			for (colour, pen_width, style), lines in self.ProjectSegments(width, height):
+				pens.append(((colour, pen_width, _RAPID_DASHES if style == wx.DOT_DASH else None), lines))
+		background = self.GetBackgroundColour().GetAsString(wx.C2S_HTML_SYNTAX)
+		image = rasterize(pens, width, height, background, self._pool)
+		self._bitmap = wx.BitmapFromBufferRGBA(width, height, image)
+
+	def DrawSegments(self, dc, width, height):
+		"""Draw the moves of all files, one DrawLineList call per pen, see ProjectSegments."""
+		for key, lines in self.ProjectSegments(width, height):
+			dc.DrawLineList(np.rint(lines).astype(np.int32).tolist(), self.GetPen(*key))
+
+	def ProjectSegments(self, width, height):
+		"""
+		Project the moves of all files onto the drawn area, grouped by pen.
+		
+		Rapid moves of every file share the move pen, feed moves and
+		arcs (cut into short lines) share the pen of their file colour.
+		Only the moves crossing the width x height area drawn are
+		projected onto it, the others are culled by the grid index of
+		their layer. Zoomed out, the layers' level of detail for the
+		current scale is drawn instead of every move. The layers keep
+		their lines scaled to pixels (see LAYER.pixels), so unless the
+		view plane or scale changed they are only moved to the center.
+		While the XYZ view is orbited, the ORBIT_LAYER of every file is
+		drawn whole instead.
+		
+		@return:
+		list of ((colour, width, style) of the pen, lines), lines the
+		(N,4) array of the lines in unscrolled pixel coordinates
+		
+		"""
+		# drawn area in view plane coordinates
+		u0 = -self._center.x / self._scale
+		u1 = (width - self._center.x) / self._scale
+		v0 = (self._center.y - height) / self._scale
+		v1 = self._center.y / self._scale
+
+		groups = {} # pen key -> list of (N,4) view plane line arrays
+		self._drawn = set()
+		for patterns in gPATTERNS:
+			if self._orbiting:
+				kinds = self.GetOrbitLayer(patterns).pixels(self._angles, self._scale)
+			else:
+				kinds = []
+				for layer in self.GetLayers(patterns, (u0, v0, u1, v1)):
+					lines, grid = layer.pixels(self._scale, (u0, v0, u1, v1))
+					if (grid is None):
+						continue # nothing left at this scale
+					visible = grid.query(u0, v0, u1, v1)
+					if (visible is not None):
+						lines = lines[visible]
+					kinds.append((layer.kind, lines))
+			for kind, lines in kinds:
+				if (len(lines) == 0):
+					continue
+				if (kind == 0):	# rapid moves
+					key = (self._move_colour, 1, wx.DOT_DASH)
+				else:
+					key = (patterns.colour, 1, wx.SOLID)
+				groups.setdefault(key, []).append(lines)
+		for key in self._layers.keys():
+			if (len(key) == 3 and key not in self._drawn and not self._orbiting):
+				del self._layers[key] # a block out of sight
+
+		pens = []
+		for key, lines in groups.items():
+			lines = np.concatenate(lines) # a copy, the layers' lines are kept
+			lines += (self._center.x, self._center.y) * 2
+			pens.append((key, lines))
+		return pens
+
+	def GetLayers(self, patterns, area):
+		"""
+		Get the moves of a file projected onto the current view plane.
+		
+		@parameters:
+		PATTERN of the file
+		(u0, v0, u1, v1) view plane area drawn
 		
+		@return:
+		list of LAYERs and ARC_LAYERs, kind 0 for the rapid and 1 for
+		the feed moves
+		
+		Layers are built once per file and view plane, invalidate() drops
+		them. The moves are drawn moved by the file's transform, which is
+		folded into the projection. The moves of a toolpath file (see read_toolpath) are
+		projected by block instead, and only the blocks in the area drawn:
+		layers of the blocks out of sight are dropped by DrawSegments, so
+		the memory used follows what is on screen.
+		
+		"""
+		seg = patterns.segments
+		if (seg.blocks is not None):
+			u0, v0, u1, v1 = area
+			boxes = project_bounds(seg.blocks, self._view_point, self._angles, patterns.transform)
+			visible = ((boxes[:,0] <= u1) & (boxes[:,2] >= u0) & (boxes[:,1] <= v1) & (boxes[:,3] >= v0))
+			layers = []
+			for block in np.flatnonzero(visible):
+				key = (patterns, self.ViewKey(), block)
+				if key not in self._layers:
+					start = block * _TOOLPATH_BLOCK
+					self._layers[key] = self.MakeLayers(seg.view(start, start + _TOOLPATH_BLOCK), patterns.transform)
+				self._drawn.add(key)
+				layers.extend(self._layers[key])
+			return layers
+		key = (patterns, self.ViewKey())
+		layers = self._layers.get(key)
+		if (layers is None):
+			layers = self._layers[key] = self.MakeLayers(seg, patterns.transform)
+		return layers
+
+	def GetOrbitLayer(self, patterns):
+		"""Get the ORBIT_LAYER of a file, built once like its layers."""
+		key = (patterns, 'orbit')
+		layer = self._layers.get(key)
+		if (layer is None):
+			layer = self._layers[key] = ORBIT_LAYER(patterns.segments, patterns.transform)
+		return layer
+
+	def MakeLayers(self, seg, transform=None):
+		"""Project SEGMENTS, moved by transform, onto the current view plane, see GetLayers."""
+		layers = [LAYER(kind, lines) for kind, lines in view_lines(seg, self._view_point, self._angles, transform=transform)]
+		arc = seg.style >= 2
+		if arc.any():
+			layers.append(ARC_LAYER(seg.start[arc], seg.end[arc], seg.center[arc], seg.style[arc],
+				seg.plane[arc], self._view_point, self._arc_tolerance, transform, self._angles))
+		return layers
+
+	def GetPen(self, colour, width, style):
+		"""Return a cached wx.Pen, so that repaints don't create pens."""
+		key = (colour, width, style)
+		pen = self._pens.get(key)
+		if (pen is None):
+			pen = self._pens[key] = wx.Pen(colour, width, style)
+		return pen
+
 	def DrawAxis(self, dc):
-		"""Draw the cartesian coordinate axis."""		
-		view_offset = self.CalcUnscrolledPosition(0,0) # translate scrolled and unscrolled
+		"""Draw the cartesian coordinate axis, in unscrolled coordinates."""		
 		center = self._center
 
 		axisLength = 45.0
-		origin = POINT(self._center.x - view_offset[0], self._center.y - view_offset[1], self._center.z)
+		origin = POINT(self._center.x, self._center.y, self._center.z)
 
-		dc.SetPen(wx.Pen('BLACK', 2, wx.SOLID)) # penwidth 2
+		dc.SetPen(self.GetPen('BLACK', 2, wx.SOLID)) # penwidth 2
 
 		if (self._view_point==0):	#XY
 			dc.DrawLines( ([origin.x,origin.y], [origin.x+axisLength,origin.y]) )	#X axis
@@ -429,21 +929,21 @@ class Paint(wx.ScrolledWindow):
 			dc.DrawLines( ([origin.x,origin.y], [origin.x,origin.y-axisLength]) )	#Z axis
 			
 		else: #XYZ
-			co1,co2 = change_view( POINT(0.0,0.0,0.0), POINT(axisLength, 0.0, 0.0) )
-			x1 =  co1.x+self._center.x - view_offset[0]
-			y1 = -co1.y+self._center.y - view_offset[1]
+			co1,co2 = change_view( POINT(0.0,0.0,0.0), POINT(axisLength, 0.0, 0.0), angles=self._angles )
+			x1 =  co1.x+self._center.x
+			y1 = -co1.y+self._center.y
 			point1 = [x1, y1]
-			x2 =  co2.x+self._center.x - view_offset[0]
-			y2 = -co2.y+self._center.y - view_offset[1]
+			x2 =  co2.x+self._center.x
+			y2 = -co2.y+self._center.y
 			point2 = [x2, y2]
 			dc.DrawLines((point1,point2))	#X axis
 			
-			co1,co2 = change_view( POINT(0.0,0.0,0.0), POINT(0.0, axisLength, 0.0) )
-			x1 =  co1.x+self._center.x - view_offset[0]
-			y1 = -co1.y+self._center.y - view_offset[1]
+			co1,co2 = change_view( POINT(0.0,0.0,0.0), POINT(0.0, axisLength, 0.0), angles=self._angles )
+			x1 =  co1.x+self._center.x
+			y1 = -co1.y+self._center.y
 			point1 = [x1, y1]
-			x2 =  co2.x+self._center.x - view_offset[0]
-			y2 = -co2.y+self._center.y - view_offset[1]
+			x2 =  co2.x+self._center.x
+			y2 = -co2.y+self._center.y
 			point2 = [x2, y2]
 			dc.DrawLines((point1,point2))	#Y axis
 			
@@ -463,7 +963,7 @@ class Paint(wx.ScrolledWindow):
 		#penwidth = max(1.0,self.filament_width*((self.scale[0]+self.scale[1])/2.0))
 		#for pen in self.penslist:
 		#	pen.SetWidth(penwidth)
-		self.Refresh(True)
+		self.Redraw(True)
         
 	def OnMouseWheel(self, e):
 		"""The mousewheel makes the image Zoom in, or out."""
@@ -472,7 +972,6 @@ class Paint(wx.ScrolledWindow):
 			self.zoom(e.GetX(), e.GetY(), 0, 1.2)
 		elif w < 0:
 			self.zoom(e.GetX(), e.GetY(), 0, 1/1.2)			
-		self.Refresh(True)
 		
 	def OnDrag(self, event):
 		pos = event.GetPosition()
@@ -487,6 +986,7 @@ class Paint(wx.ScrolledWindow):
 		gMouseLeftDown[0] = 1
 		gMouseLeftDown[1] = pos.x
 		gMouseLeftDown[2] = pos.y
+		self._orbit_from = None
 		#print "Left Down: pos=" + str(pos)
 		
 	def OnMouseRightDown(self, event):
@@ -505,7 +1005,10 @@ class Paint(wx.ScrolledWindow):
 
 		pos = event.GetPosition()
 		size = self.GetSize()
-		if gMouseLeftDown[0]:
+		if (gMouseLeftDown[0] and self._orbit_from is not None):
+			gMouseLeftDown[0] = 0
+			self.EndOrbit()
+		elif gMouseLeftDown[0]:
 			gMouseLeftDown[0] = 0
 			pre_mag = self._mag
 			dx = pos.x - gMouseLeftDown[1]
@@ -532,7 +1035,7 @@ class Paint(wx.ScrolledWindow):
 				self._shiftX = float(self._centerX) - (self._mag*(float(cx)-self._shiftX))/pre_mag
 				self._shiftY = float(self._centerY) - (self._mag*(float(cy)-self._shiftY))/pre_mag
 
-			self.Refresh(True)
+			self.Redraw()
 
 	def OnMouseRightUp(self, event):
 
@@ -553,7 +1056,26 @@ class Paint(wx.ScrolledWindow):
 		pos = event.GetPosition()
 		
 	def OnMouseMove(self, event):
+		"""Dragging with the left button down orbits the XYZ view."""
 		pos = event.GetPosition()
+		if (self._orbit_from is not None and not event.LeftIsDown()):
+			self.EndOrbit() # released outside the window
+			return
+		if (self._view_point != 3 or not gMouseLeftDown[0] or not event.Dragging()):
+			return
+		x, y = self._orbit_from or gMouseLeftDown[1:]
+		self._orbit_from = (pos.x, pos.y)
+		theta, phi, psi = self._angles
+		theta += (pos.x - x) * self._orbit_rate
+		phi = min(max(phi + (pos.y - y) * self._orbit_rate, -pi/2), pi/2)
+		self._orbit_until = time.time() + self._settle
+		self.angles = (theta, phi, psi)
+
+	def EndOrbit(self):
+		"""Render the paths whole at the angles the orbit ended with."""
+		self._orbit_from = None
+		self._orbit_until = 0.0
+		self.Redraw()
 
 
 class OpenFiles(wx.Dialog):
@@ -562,7 +1084,8 @@ class OpenFiles(wx.Dialog):
 	
 	"""
 	_inch_flag = 0
-	_gcode_ext = '*.ngc'
+	_gcode_ext = ('G-code (*.ngc)|*.ngc;*.ngc.gz;*.ngc.bz2;*.ngc.xz|Toolpath (*.gtp)|*.gtp|'
+		'All files (*.*)|*.*')
 	_default_colour = 'CADET BLUE' # Cadet blue
 
 	_colours = [
@@ -589,6 +1112,10 @@ class OpenFiles(wx.Dialog):
 	def __init__(self, parent, id, title):
 		wx.Dialog.__init__(self, parent, id, title, size=(250, 210))
 		self.dirname=''
+		self.load = [] # GCODEs to parse after the dialog closed
+		self.transformed = [] # GCODEs to move, see MainFrame.SetTransform
+		self._inch_flag = int(gUNIT == 25.4) # keep the unit of the loaded files
+		self.cleared = False # NEW emptied gGCODES
 
 		panel = wx.Panel(self, -1)
 		sizer = wx.GridBagSizer(0, 0)
@@ -685,83 +1212,706 @@ class OpenFiles(wx.Dialog):
 		dlg.Destroy()
 
 	def OnAppend(self,e):
-		"""Add another file to be opened together with a previously selected file or files."""
+		"""
+		Add another file to be opened together with a previously selected
+		file or files. Without a file, the rotation, shift and unit are
+		applied to the files already in the list instead.
+		
+		"""
 
 		global gGCODES, gRotation_Angle, gSHIFT_X, gSHIFT_Y
 
-		if ( self.gcode.GetValue() ):
-			gGCODES.append(GCODE(self.gcode.GetValue(), self.gcode_colour.GetValue())) # add G-code file to the list
 		if(self.rot_ang.GetValue()):
 			gRotation_Angle = int(self.rot_ang.GetValue())
 		if(self.shift_x.GetValue()):
 			gSHIFT_X = int(self.shift_x.GetValue())
 		if(self.shift_y.GetValue()):
 			gSHIFT_Y = int(self.shift_y.GetValue())
-		set_unit()		
-		parseGCodeFile() # parse the G-code file
+		set_unit(self._inch_flag)
+		if ( self.gcode.GetValue() ):
+			gGCODES.append(GCODE(self.gcode.GetValue(), self.gcode_colour.GetValue(), file_transform())) # add G-code file to the list
+			self.load = gGCODES[-1:] # the files already in the list are loaded
+		else:
+			self.transformed = [gcodes for gcodes in gGCODES if gcodes.transform != file_transform()]
 		self.Close(True)  # close the frame
 		
 	def OnNEW(self,e):
 
-		global gGCODES, gPATTERNS, gRotation_Angle, gSHIFT_X, gSHIFT_Y
+		global gGCODES, gPATTERNS, gBOUNDS, gRotation_Angle, gSHIFT_X, gSHIFT_Y
 
 		gGCODES = [] # clear list
 		gPATTERNS = []
-		if ( self.gcode.GetValue() ):
-			gGCODES.append(GCODE(self.gcode.GetValue(), self.gcode_colour.GetValue())) # put G-code file into the list
+		self.cleared = True
+		gBOUNDS = np.zeros((2,3))
 		if(self.rot_ang.GetValue()):
 			gRotation_Angle = int(self.rot_ang.GetValue())
 		if(self.shift_x.GetValue()):
 			gSHIFT_X = int(self.shift_x.GetValue())
 		if(self.shift_y.GetValue()):
 			gSHIFT_Y = int(self.shift_y.GetValue())
-		set_unit()
-		parseGCodeFile() # parse the G-code file
+		set_unit(self._inch_flag)
+		if ( self.gcode.GetValue() ):
+			gGCODES.append(GCODE(self.gcode.GetValue(), self.gcode_colour.GetValue(), file_transform())) # put G-code file into the list
+		self.load = list(gGCODES) # parse the G-code file
 		self.Close(True)  # close the frame
 		
 	def OnClose(self,e):
 		self.Close(True)  # close the frame
 		
 
-class POINT:
-	def __init__(self, x, y, z):
-		self.x = x
-		self.y = y
-		self.z = z
-
-class LINE:
-	def __init__(self, style, line, speed, points):
-		self.style = style
-		self.line = line
-		self.speed = speed
-		self.points = points
-
-class ARC:
-	def __init__(self, style, line, speed, plane, p1, p2, center):
-		self.style = style
-		self.line = line
-		self.speed = speed
-		self.plane = plane
-		self.p1 = p1
-		self.p2 = p2
-		self.center = center
+class LoadThread(threading.Thread):
+	"""
+	Parse G-code files in the background.
+	
+	The GUI thread is told about every file and every parsed chunk of
+	moves through wx.CallAfter, so the data and the drawing are only ever
+	changed by the GUI thread: window.OnLoadFile(thread, gcodes, pattern)
+	when a file starts, window.OnLoadChunk(thread, pattern, chunk, nbytes,
+	message) per chunk, window.OnLoadState(thread, gcodes, modal, parsed)
+	when a file is done and window.OnLoadDone(thread) at the end.
+	
+	Only the files that changed since their last load are parsed (see
+	GCODE.changes): a file that only grew has just its new bytes parsed,
+	from the modal state its last load ended with, and appended to its
+	pattern; any other changed file is parsed again into a new pattern.
+	The moves are kept as written in the file, the file's rotation and
+	shift are applied when drawing (see GCODE.transform).
+	
+	"""
+	redraw_interval = 1.0 # seconds between redraws of partly loaded files
+
+	def __init__(self, window, gcodes):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.window = window
+		self.gcodes = [] # to parse whole
+		self.tails = [] # to parse the new bytes of
+		for gcode in gcodes:
+			change = gcode.changes()
+			if (change == 'all'):
+				self.gcodes.append(gcode)
+			elif (change == 'tail'):
+				self.tails.append(gcode)
+		self.total_bytes = (sum(file_size(gcodes.name) for gcodes in self.gcodes) +
+			sum(max(0, file_size(gcodes.name) - gcodes.modal.offset) for gcodes in self.tails))
+		self._cancel = threading.Event()
+
+	def cancel(self):
+		"""Stop after the chunk being parsed."""
+		self._cancel.set()
+
+	def run(self):
+		done = 0 # bytes of the tails parsed
+		for gcodes in self.tails:
+			if self._cancel.isSet():
+				break
+			if gcodes.prefix_unchanged():
+				done = self.run_tail(gcodes, done)
+			else:
+				self.gcodes.append(gcodes) # edited, not only grown
+				self.total_bytes += gcodes.modal.offset
+		gcodes = [gcode for gcode in self.gcodes if not self.run_cached(gcode)]
+		if self._cancel.isSet():
+			pass
+		elif (len(gcodes) > 1):
+			self.run_parallel(gcodes)
+		elif (gcodes and multiprocessing.cpu_count() > 1 and
+				file_size(gcodes[0].name) >= _PARALLEL_BYTES and not compression(gcodes[0].name)):
+			self.run_ranges(gcodes[0])
+		elif gcodes:
+			self.run_chunks(gcodes[0])
+		wx.CallAfter(self.window.OnLoadDone, self)
+
+	def run_tail(self, gcodes, done):
+		"""
+		Parse the bytes a file grew by since its last load, handing over
+		every chunk. Returns done plus the bytes parsed.
+		
+		"""
+		stat = file_stat(gcodes.name)
+		modal = copy.copy(gcodes.modal)
+		try:
+			f = open(gcodes.name,'rb')
+		except IOError, (errno, strerror):
+			wx.CallAfter(error_dialog, "Unable to open the file" + gcodes.name + "\n", False)
+			return done
+		f.seek(modal.offset)
+		wx.CallAfter(self.window.OnLoadFile, self, gcodes, gcodes.pattern)
+		start = copy.copy(modal)
+		for chunk in iter_segments(f, modal=modal):
+			if self._cancel.isSet():
+				break
+			message = "%s: %d new lines" % (os.path.basename(gcodes.name), modal.line - start.line)
+			wx.CallAfter(self.window.OnLoadChunk, self, gcodes.pattern, chunk,
+				done + modal.offset - start.offset, message)
+		f.close()
+		self.finish(gcodes, stat, modal)
+		return done + modal.offset - start.offset
+
+	def run_cached(self, gcodes):
+		"""
+		Hand over a toolpath file, or a file found in gCACHE, whole.
+		Returns False if the file has to be parsed.
+		
+		"""
+		if self._cancel.isSet():
+			return False
+		stat = file_stat(gcodes.name)
+		modal = MODAL()
+		if is_toolpath(gcodes.name):
+			try:
+				segments = read_toolpath(gcodes.name, modal)
+			except IOError:
+				wx.CallAfter(error_dialog, "Unable to read the toolpath file" + gcodes.name + "\n", False)
+				return True
+		else:
+			segments = gCACHE.load(gcodes.name, modal=modal) if gCACHE else None
+			if (segments is None): # a file without moves is a hit too
+				return False
+		pattern = PATTERN(gcodes.colour, SEGMENTS(), gcodes.matrix())
+		wx.CallAfter(self.window.OnLoadFile, self, gcodes, pattern)
+		message = "%s: %d moves" % (os.path.basename(gcodes.name), len(segments))
+		wx.CallAfter(self.window.OnLoadChunk, self, pattern, segments, self.total_bytes, message)
+		self.finish(gcodes, stat, modal)
+		return True
+
+	def run_chunks(self, gcodes):
+		"""Parse a single file, handing over every chunk."""
+		stat = file_stat(gcodes.name)
+		try:
+			f = open_gcode(gcodes.name)
+		except IOError, error:
+			wx.CallAfter(error_dialog, "Unable to open the file" + gcodes.name + "\n", False)
+			return
+		pattern = PATTERN(gcodes.colour, SEGMENTS(), gcodes.matrix())
+		wx.CallAfter(self.window.OnLoadFile, self, gcodes, pattern)
+		whole = SEGMENTS() # for gCACHE
+		modal = MODAL()
+		try:
+			for chunk in iter_segments(f, modal=modal):
+				if self._cancel.isSet():
+					break
+				whole.extend(chunk)
+				message = "%s: %d lines" % (os.path.basename(gcodes.name), modal.line - 1)
+				# f.tell(): bytes read of the file, which may be compressed
+				wx.CallAfter(self.window.OnLoadChunk, self, pattern, chunk, f.tell(), message)
+		except IOError, error:
+			wx.CallAfter(error_dialog, str(error) + "\n", False)
+			return
+		finally:
+			f.close()
+		self.store(gcodes, whole, modal)
+		self.finish(gcodes, stat, modal)
+
+	def run_ranges(self, gcodes):
+		"""Parse a single, big, file in parallel byte ranges, handing over every range."""
+		stat = file_stat(gcodes.name)
+		pattern = PATTERN(gcodes.colour, SEGMENTS(), gcodes.matrix())
+		wx.CallAfter(self.window.OnLoadFile, self, gcodes, pattern)
+		whole = SEGMENTS() # for gCACHE
+		modal = MODAL()
+		try:
+			for chunk, nbytes in parse_gcode_parallel(gcodes.name, cancel=self._cancel, modal=modal):
+				whole.extend(chunk)
+				message = "%s: %d%%" % (os.path.basename(gcodes.name), 100 * nbytes / max(self.total_bytes, 1))
+				wx.CallAfter(self.window.OnLoadChunk, self, pattern, chunk, nbytes, message)
+		except IOError:
+			wx.CallAfter(error_dialog, "Unable to open the file" + gcodes.name + "\n", False)
+			return
+		self.store(gcodes, whole, modal)
+		self.finish(gcodes, stat, modal)
+
+	def store(self, gcodes, segments, modal):
+		"""Keep a fully parsed single file in gCACHE."""
+		if (gCACHE and not self._cancel.isSet()):
+			segments.trim()
+			gCACHE.store(gcodes.name, 0.0, 0, 0, segments, modal)
+
+	def finish(self, gcodes, stat, modal):
+		"""
+		Tell the GUI thread the state a file was loaded in.
+		
+		@parameters:
+		the GCODE
+		file_stat() from before the parsing
+		MODAL after the parsed bytes
+		
+		"""
+		if (stat and not self._cancel.isSet()):
+			wx.CallAfter(self.window.OnLoadState, self, gcodes, modal, file_stamp(gcodes.name, modal.offset, stat))
+
+	def run_parallel(self, gcodes_list):
+		"""Parse each file in its own worker process, handing over whole files."""
+		patterns = []
+		stats = []
+		for gcodes in gcodes_list:
+			stats.append(file_stat(gcodes.name))
+			patterns.append(PATTERN(gcodes.colour, SEGMENTS(), gcodes.matrix()))
+			wx.CallAfter(self.window.OnLoadFile, self, gcodes, patterns[-1])
+		done = 0
+		names = [gcodes.name for gcodes in gcodes_list]
+		for n, segments, modal, error in parse_files(names, cancel=self._cancel, cache=gCACHE):
+			if error:
+				wx.CallAfter(error_dialog, error, False)
+				continue
+			done += file_size(names[n])
+			message = "%s: %d moves" % (os.path.basename(names[n]), len(segments))
+			wx.CallAfter(self.window.OnLoadChunk, self, patterns[n], segments, done, message)
+			self.finish(gcodes_list[n], stats[n], modal)
+
 
 class GCODE:
-	def __init__(self, name, colour):
+	def __init__(self, name, colour, transform=(0.0, 0, 0, 1.0)):
 		self.name = name
 		self.colour = colour
+		self.transform = transform # (rot_ang (radians), xshift, yshift, unit) the moves are drawn with
+		self.pattern = None # PATTERN of the file, once loading started
+		self.patterns = [] # all its PATTERNs, pattern last: a stream has several, see StreamThread
+		self.modal = None # MODAL after the loaded bytes, None until a load is finished
+		self.parsed = None # file_stamp() of the finished load
+
+	def matrix(self):
+		"""The transform as a matrix, see transform_matrix; None for none."""
+		if (self.transform == (0.0, 0, 0, 1.0)):
+			return None
+		return transform_matrix(*self.transform)
+
+	def changes(self):
+		"""
+		What has to be parsed to bring the pattern up to date with the file.
+		The transform is not part of it, the moves are parsed as written.
+		
+		Only the size and time of the file are looked at, so that it can
+		be called on the GUI thread; whether the loaded bytes are unchanged
+		is left to the LoadThread, see prefix_unchanged.
+		
+		@return:
+		None - nothing, the file is unchanged
+		'tail' - the bytes from modal.offset on, if the loaded bytes are
+		  unchanged: the file grew and the loaded bytes end with a whole
+		  line
+		'all' - the whole file
+		
+		"""
+		if is_stream(self.name):
+			return None # see StreamThread
+		if (self.pattern is None or self.modal is None or self.parsed is None):
+			return 'all'
+		stat = file_stat(self.name)
+		if (stat is None):
+			return 'all'
+		if ((stat.st_size, stat.st_mtime) == self.parsed[:2]):
+			return None
+		if (stat.st_size > self.modal.offset and self.parsed[3] in ('', '\n') and
+				not is_toolpath(self.name) and not compression(self.name)):
+			return 'tail'
+		return 'all'
+
+	def prefix_unchanged(self):
+		"""
+		True if the bytes loaded are still those of the file, compared by
+		their hash (see file_stamp). Reads them all, so it is for the
+		LoadThread, not the GUI thread.
+		
+		"""
+		new = file_stamp(self.name, self.modal.offset)
+		return new is not None and new[2:] == self.parsed[2:]
+
+class SEGMENT_GRID:
+	"""
+	Uniform grid index over 2D line segments, to find the segments that
+	cross a rectangle without testing every one of them.
+	
+	Segments not longer than a cell on either axis are filed under the
+	cell of their first end point, so a query only has to look at the
+	cells of the rectangle grown by one cell. Longer segments (typically
+	rapid moves across the part) are kept apart and always tested.
+	
+	"""
+	def __init__(self, lines, cells=256):
+		"""
+		@parameters:
+		(N,4) array of segments x1,y1,x2,y2, N > 0
+		number of cells along the longest side of the grid
+		
+		"""
+		self.lines = lines
+		self.lo = np.minimum(lines[:,0:2].min(axis=0), lines[:,2:4].min(axis=0))
+		self.hi = np.maximum(lines[:,0:2].max(axis=0), lines[:,2:4].max(axis=0))
+		self.cell = max(float((self.hi - self.lo).max()) / cells, 1e-9)
+		self.nx, self.ny = (np.floor((self.hi - self.lo) / self.cell).astype(int) + 1).tolist()
+
+		small = ((np.abs(lines[:,2] - lines[:,0]) <= self.cell) &
+			(np.abs(lines[:,3] - lines[:,1]) <= self.cell))
+		self.large = np.flatnonzero(~small).astype(np.int32)
+		index = np.flatnonzero(small).astype(np.int32)
+		cx, cy = self.cell_of(lines[index,0], lines[index,1])
+		cell = cy * self.nx + cx
+		order = np.argsort(cell, kind='mergesort')
+		self.index = index[order]
+		self.cells = cell[order].astype(np.int32)
+
+	def cell_of(self, x, y):
+		"""Grid column and row of points, clipped to the grid."""
+		cx = np.clip(np.floor((x - self.lo[0]) / self.cell), 0, self.nx-1).astype(np.int32)
+		cy = np.clip(np.floor((y - self.lo[1]) / self.cell), 0, self.ny-1).astype(np.int32)
+		return cx, cy
+
+	def query(self, x0, y0, x1, y1):
+		"""
+		Find the segments whose bounding box meets the rectangle.
+		
+		@return:
+		array of segment indices, or None when the rectangle holds the
+		whole grid (all segments)
+		
+		"""
+		if (x0 <= self.lo[0] and y0 <= self.lo[1] and x1 >= self.hi[0] and y1 >= self.hi[1]):
+			return None
+		if (x1 < self.lo[0] or y1 < self.lo[1] or x0 > self.hi[0] or y0 > self.hi[1]):
+			return np.zeros(0, np.int32)
+
+		(cx0, cx1), (cy0, cy1) = self.cell_of(
+			np.array((x0 - self.cell, x1 + self.cell)), np.array((y0 - self.cell, y1 + self.cell)))
+		rows = np.arange(cy0, cy1+1) * self.nx
+		first = np.searchsorted(self.cells, rows + cx0, 'left')
+		last = np.searchsorted(self.cells, rows + cx1, 'right')
+		found = [self.index[i:j] for i, j in zip(first.tolist(), last.tolist()) if j > i]
+		found.append(self.large)
+		found = np.concatenate(found)
+
+		l = self.lines[found]
+		hit = ((np.minimum(l[:,0], l[:,2]) <= x1) & (np.maximum(l[:,0], l[:,2]) >= x0) &
+			(np.minimum(l[:,1], l[:,3]) <= y1) & (np.maximum(l[:,1], l[:,3]) >= y0))
+		return found[hit]
+
+class LAYER:
+	"""
+	Moves of one kind from one file, projected onto a view plane.
+	
+	Holds the (N,4) view plane lines x1,y1,x2,y2 in move order with their
+	SEGMENT_GRID, the level-of-detail pyramid built from them and the
+	lines of the last scale drawn in pixels.
+	
+	"""
+	# levels keeping more than this fraction of the lines aren't worth it
+	_lod_min_gain = 0.5
+
+	def __init__(self, kind, lines):
+		self.kind = kind
+		self.lines = lines
+		self.grid = SEGMENT_GRID(lines)
+		self._levels = {} # level -> (lines, grid)
+		self._full = None # levels up to this one draw all lines
+		self._pixels = None # (scale, lines in pixels, grid)
+
+	def level(self, scale):
+		"""
+		Get the lines and grid to draw at a scale.
+		
+		Level k snaps the end points to a grid of 2**k units, the largest
+		one not coarser than a pixel at the scale (pixels per unit), drops
+		the lines that collapse to a point and keeps one of the lines
+		that snap onto the same cells. Shared end points snap together, so
+		chains of moves stay connected and nothing moves by more than a
+		pixel, while dense areas shrink to a few lines per pixel.
+		
+		@return:
+		(N,4) lines and their SEGMENT_GRID, None when no line is left
+		(moves seen end on, such as plunges in the XY view)
+		
+		"""
+		k = int(floor(log(1.0/scale, 2)))
+		if (self._full is not None and k <= self._full):
+			return self.lines, self.grid
+		if (k not in self._levels):
+			lines = snap_lines(self.lines, 2.0**k)
+			if (len(lines) > self._lod_min_gain * len(self.lines)):
+				self._full = max(k, self._full)
+				return self.lines, self.grid
+			self._levels[k] = (lines, SEGMENT_GRID(lines) if len(lines) else None)
+		return self._levels[k]
+
+	def pixels(self, scale, area=None):
+		"""
+		Get the lines to draw at a scale in pixels, relative to the
+		drawing center (y pointing down), and the grid of their view
+		plane lines, see level. The lines of the last scale are kept: the
+		layer is dropped when its data or transform change (see
+		Paint.invalidate), and a center that moved is a translation.
+		All lines are kept whatever the area drawn, see ARC_LAYER.pixels.
+		
+		"""
+		if (self._pixels is None or self._pixels[0] != scale):
+			lines, grid = self.level(scale)
+			self._pixels = (scale, lines * (scale, -scale, scale, -scale), grid)
+		return self._pixels[1:]
+
+class ARC_LAYER:
+	"""
+	Arcs from one file, projected onto a view plane.
+	
+	Arcs are cut into lines within a chord error in pixels, so the lines
+	needed grow with the scale. Scales are bucketed by powers of two:
+	the arcs are cut per bucket, for the largest scale in it, and the
+	lines are kept as a LAYER, with its grid and level of detail, for
+	the buckets next to the one drawn last. Zooming back and forth
+	reuses them.
+	
+	Only the arcs in the area drawn are cut: a SEGMENT_GRID over their
+	view plane boxes (center +- radius) finds them, and a bucket cuts
+	more of its arcs as they come into sight. Zoomed in on a few arcs,
+	only those few are cut, however many the file has.
+	
+	"""
+	kind = 1 # drawn with the feed moves
+
+	def __init__(self, start, end, center, style, plane, view, tolerance, transform=None, angles=None):
+		"""
+		@parameters:
+		arcs, see arc_tessellate
+		view plane, see project_lines
+		chord error allowed (pixels)
+		transform of the file, see transform_matrix
+		rotation angles of the XYZ view, see project_lines
+		
+		"""
+		self.arcs = (start, end, center, style, plane)
+		self.view = view
+		self.tolerance = tolerance
+		self.transform = transform
+		self.angles = angles
+		self._buckets = {} # log2 of the scale -> [LAYER or None, arcs cut]
+		r = arc_sweeps(start, end, center, style, plane)[2][:,None]
+		boxes = np.array((np.minimum(np.minimum(start, end), center - r),
+			np.maximum(np.maximum(start, end), center + r))).transpose(1, 0, 2)
+		# a box u0,v0,u1,v1 is indexed as the line from one corner to the other
+		self.grid = SEGMENT_GRID(project_bounds(boxes, view, angles, transform))
+
+	def bucket(self, scale, area):
+		"""
+		Get the LAYER of the arcs cut for a scale, holding at least the
+		arcs in the (u0, v0, u1, v1) view plane area; None if there are
+		none yet.
+		
+		"""
+		k = int(floor(log(scale, 2)))
+		bucket = self._buckets.get(k)
+		if (bucket is None):
+			for other in self._buckets.keys():
+				if abs(other - k) > 1:
+					del self._buckets[other]
+			bucket = self._buckets[k] = [None, np.zeros(len(self.arcs[0]), bool)]
+		layer, cut = bucket
+		visible = self.grid.query(*area)
+		new = np.flatnonzero(~cut) if (visible is None) else visible[~cut[visible]]
+		if (len(new) > 0):
+			cut[new] = True
+			lines = project_arcs(*([arcs[new] for arcs in self.arcs] +
+				[self.view, self.tolerance / 2.0**(k+1), self.angles, self.transform]))
+			if (layer is not None):
+				lines = np.concatenate((layer.lines, lines))
+			layer = bucket[0] = LAYER(self.kind, lines)
+		return layer
+
+	def pixels(self, scale, area):
+		"""
+		Get the lines to draw at a scale in pixels, see LAYER.pixels;
+		their grid is None if no arc is in the (u0, v0, u1, v1) area.
+		
+		"""
+		layer = self.bucket(scale, area)
+		if (layer is None):
+			return np.zeros((0,4)), None
+		return layer.pixels(scale)
+
+class ORBIT_LAYER:
+	"""
+	Moves from one file, thinned out in space, drawn while the XYZ view
+	is orbited (see Paint.OnMouseMove).
+	
+	The transformed end points are snapped to a grid of _cells cells
+	along the longest side of the file's bounds, and the lines that
+	collapse to a point or repeat are dropped, as by LAYER.level but in
+	space instead of on a view plane. The grid is made coarser until at
+	most _max_lines lines are left. So the same few lines serve any
+	angles: a frame of the orbit only projects them, one matrix product
+	per kind. Arcs are cut into lines within a chord error of a cell.
+	
+	The moves are snapped _batch at a time, so the memory used stays
+	small. Of a toolpath file (see read_toolpath) bigger than _max_moves
+	moves only as many, in whole blocks spread over the file, are read.
+	
+	"""
+	_cells = 128
+	_max_lines = 25000
+	_batch = 1 << 18 # moves snapped at a time
+	_max_moves = 1 << 21 # moves read of a toolpath file
+
+	def __init__(self, seg, transform=None):
+		"""
+		@parameters:
+		SEGMENTS
+		transform of the file, see transform_matrix
+		
+		"""
+		bounds = transform_bounds(seg.bounds, transform)
+		extent = float((bounds[1] - bounds[0]).max()) if bounds is not None else 0.0
+		self.size = 2.0**ceil(log(max(extent, 1e-6) / self._cells, 2))
+		self.transform = transform
+		self.kinds = [(0, np.zeros((0,6))), (1, np.zeros((0,6)))] # (kind, (N,6) lines x1,y1,z1,x2,y2,z2)
+		for start, stop in self.ranges(seg):
+			for first in range(start, stop, self._batch):
+				part = seg.view(first, min(first + self._batch, stop))
+				self.kinds = [(kind, snap_lines(np.concatenate((lines, new)), self.size))
+					for (kind, lines), new in zip(self.kinds, self.space_lines(part))]
+				while (sum(len(lines) for kind, lines in self.kinds) > self._max_lines):
+					# snapped lines snap onto a coarser grid as the moves would
+					self.size *= 4 if sum(len(lines) for kind, lines in self.kinds) > 4 * self._max_lines else 2
+					self.kinds = [(kind, snap_lines(lines, self.size)) for kind, lines in self.kinds]
+		self.kinds = [(kind, lines) for kind, lines in self.kinds if len(lines) > 0]
+
+	def ranges(self, seg):
+		"""The (start, stop) rows of the moves to read."""
+		if (seg.blocks is None or len(seg) <= self._max_moves):
+			return [(0, len(seg))]
+		blocks = np.unique(np.linspace(0, len(seg.blocks) - 1, self._max_moves // _TOOLPATH_BLOCK).astype(int))
+		return [(block * _TOOLPATH_BLOCK, min((block + 1) * _TOOLPATH_BLOCK, len(seg))) for block in blocks.tolist()]
+
+	def space_lines(self, seg):
+		"""The (N,6) transformed lines of the rapid and of the feed moves of SEGMENTS."""
+		transform = self.transform
+		unit = abs(np.linalg.det(transform[:,:3])) ** (1.0/3) if transform is not None else 1.0
+		rapid = seg.style == 0
+		feed = seg.style == 1
+		arc = seg.style >= 2
+		feeds = [(seg.start[feed], seg.end[feed])]
+		if arc.any():
+			a0, sweep, r = arc_sweeps(seg.start[arc], seg.end[arc], seg.center[arc], seg.style[arc], seg.plane[arc])
+			feeds.append(arc_tessellate(seg.start[arc], seg.end[arc], seg.center[arc], seg.style[arc],
+				seg.plane[arc], arc_pieces(r, sweep, self.size / unit)))
+		kinds = []
+		for parts in ([(seg.start[rapid], seg.end[rapid])], feeds):
+			lines = np.concatenate([np.hstack(part).astype(float) for part in parts])
+			if (transform is not None):
+				lines = np.hstack((np.dot(lines[:,:3], transform[:,:3].T) + transform[:,3],
+					np.dot(lines[:,3:], transform[:,:3].T) + transform[:,3]))
+			kinds.append(lines)
+		return kinds
+
+	def pixels(self, angles, scale):
+		"""
+		Project the lines onto the XYZ view.
+		
+		@return:
+		list of (kind, lines), lines the (N,4) array in pixels relative
+		to the drawing center (y pointing down), see LAYER.pixels
+		
+		"""
+		return [(kind, project_lines(lines[:,:3], lines[:,3:], 3, angles) * (scale, -scale, scale, -scale))
+			for kind, lines in self.kinds]
+
+class StreamThread(threading.Thread):
+	"""
+	Parse the G-code of a live stream in the background: standard input, a
+	named pipe or a local socket, see open_stream.
+	
+	The lines received are parsed and handed over to the GUI thread in
+	batches, one per redraw_interval, the same way as by a LoadThread, so
+	that a fast stream costs the GUI thread a fixed number of events and
+	redraws per second. A new pattern is started every pattern_moves moves,
+	so that a redraw only projects the moves of the last pattern again.
+	
+	"""
+	redraw_interval = 0.1 # seconds per batch and redraw, 10 frames per second
+	pattern_moves = 20000
+
+	def __init__(self, window, gcodes):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.window = window
+		self.gcodes = gcodes
+		self._cancel = threading.Event()
+
+	def cancel(self):
+		"""Stop after the batch being read."""
+		self._cancel.set()
+
+	def run(self):
+		name = self.gcodes.name
+		try:
+			stream = open_stream(name)
+		except IOError, error:
+			wx.CallAfter(error_dialog, "Unable to open the stream " + name + ": " + str(error) + "\n", False)
+			wx.CallAfter(self.window.OnLoadDone, self)
+			return
+		modal = MODAL()
+		pattern = None
+		moves = 0 # of pattern
+		try:
+			for lines in read_lines(stream, self.redraw_interval, self._cancel):
+				for chunk in iter_segments(lines, chunk_lines=len(lines) + 1, modal=modal):
+					if (len(chunk) == 0):
+						continue
+					if (pattern is None or moves >= self.pattern_moves):
+						first = pattern is None
+						pattern = PATTERN(self.gcodes.colour, SEGMENTS(), self.gcodes.matrix())
+						moves = 0
+						wx.CallAfter(self.window.OnLoadFile, self, self.gcodes, pattern, first)
+					moves += len(chunk)
+					message = "%s: %d lines" % (name, modal.line - 1)
+					wx.CallAfter(self.window.OnLoadChunk, self, pattern, chunk, modal.offset, message)
+		except IOError, error:
+			wx.CallAfter(error_dialog, "Error reading the stream " + name + ": " + str(error) + "\n", False)
+		finally:
+			stream.close()
+		wx.CallAfter(self.window.OnLoadDone, self)
+
 
 class PATTERN:
-	def __init__(self, colour, patterns):
+	"""
+	The moves of one G-code file, the colour to draw them in and the
+	transform to draw them with (see transform_matrix, None for none).
+	
+	A thin view over a SEGMENTS store; indexing it builds the LINE or ARC
+	object of a single move on demand, as parsed.
+	
+	"""
+	def __init__(self, colour, segments, transform=None):
 		self.colour = colour
-		self.patterns = patterns
+		self.segments = segments
+		self.transform = transform
+
+	def __len__(self):
+		return len(self.segments)
+
+	def __getitem__(self, n):
+		seg = self.segments
+		style = int(seg.style[n]) # raises IndexError past the end
+		line = int(seg.line[n])
+		speed = float(seg.speed[n])
+		p1 = POINT(*seg.start[n].tolist())
+		p2 = POINT(*seg.end[n].tolist())
+		if (style == 2 or style == 3):
+			center = POINT(*seg.center[n].tolist())
+			return ARC(style, line, speed, int(seg.plane[n]), p1, p2, center)
+		return LINE(style, line, speed, [p1, p2])
 		
 
 # App Entry point
 def main():
+	global gCACHE
+	gCACHE = PARSE_CACHE()
 	app = wx.App(False) # don't redirect stdout/stderr to a window
 	#app = wx.App(True) # redirect stdout/stderr to a window
 	frame = MainFrame(None, -1, 'pyGerber2Gcode')
+	# command line: G-code files and live streams (see open_stream)
+	for name in sys.argv[1:]:
+		if is_stream(name):
+			frame.StartStream(name)
+		else:
+			gGCODES.append(GCODE(name, OpenFiles._default_colour, file_transform()))
+	frame.StartLoad([gcodes for gcodes in gGCODES if not is_stream(gcodes.name)])
 	app.MainLoop()
 
 # App Functions
@@ -784,166 +1934,15 @@ def set_unit(inches=False):
 	else:
 		gUNIT = 1.0
 
-def parseGCodeFile():
+def file_transform():
 	"""
-	Parse the G-code file.
-	The patterns read from the G-Code file(s) are stored in global gPATTERN.
+	The transform set in the OpenFiles dialog, see GCODE.
 	
-	TODO: get rid of the global variable
-	
-	LinuxCNC G-Code Quick reference: http://linuxcnc.org/docs/html/gcode.html
-	
-	@parameters
-	gGCODES global list of G-Code files
-	
-	"""
-	global gGCODES
-	rot_ang = gRotation_Angle * pi/180	
-	for gcodes in gGCODES:
-
-		try:
-			f = open(gcodes.name,'r')
-		except IOError, (errno, strerror):
-			error_dialog("Unable to open the file" + gcodes.name + "\n", True)
-		else:
-			pre_x = 0.0
-			pre_y = 0.0
-			pre_z = 0.0
-			x = pre_x
-			y = pre_y
-			z = pre_z
-			s = 0
-			l = 1
-			style = 0
-			
-			patterns = []
-			while 1:
-				gcode = f.readline()
-				if not gcode:
-					break
-				flag = 0
-
-				#parse G-code
-				gg = re.search("[gG]([\d]+)\D", gcode)
-				xx = re.search("[xX]([\d\.\-]+)\D", gcode)
-				yy = re.search("[yY]([\d\.\-]+)\D", gcode)
-				zz = re.search("[zZ]([\d\.\-]+)\D", gcode)
-				ss = re.search("[fF]([\d\.\-]+)\D", gcode)
-
-				if (gg):
-					style = int(gg.group(1))
-
-				if (xx):
-					x = float(xx.group(1))
-					flag = 1
-				if (yy):
-					y = float(yy.group(1))
-					flag = 1
-				if (zz):
-					z = float(zz.group(1))
-					flag = 1
-					
-				if (ss):
-					s = float(ss.group(1))
-
-				if (style == 1 or style == 0): # coordinated|fast move
-					if (flag):
-						center = POINT(0,0,0)
-						point1 = POINT(pre_x,pre_y,pre_z)
-						point2 = POINT(x,y,z)
-						#print point1
-						point1 = rot_point(point1, center, rot_ang)
-						point1 = shift_point(point1, gSHIFT_X, gSHIFT_Y)
-						#print point2
-						point2 = rot_point(point2, center, rot_ang)
-						point2 = shift_point(point2, gSHIFT_X, gSHIFT_Y)
-						patterns.append(LINE(style,l,s,[point1,point2]))
-						
-				elif (style == 2 or style == 3): # cw|ccw arc feed
-						i=0
-						j=0
-						k=0
-						ii = re.search("[iI]([\d\.\-]+)\D", gcode)
-						jj = re.search("[jJ]([\d\.\-]+)\D", gcode)
-						kk = re.search("[kK]([\d\.\-]+)\D", gcode)
-						rr = re.search("[rR]([\d\.\-]+)\D", gcode)
-						if (ii):
-							i = float(rr.group(1))
-						if (jj):
-							j = float(rr.group(1))
-						if (kk):
-							k = float(rr.group(1))
-						center = POINT(i,j,k)
-						point1 = POINT(pre_x,pre_y,pre_z)
-						point2 = POINT(x,y,z)
-						if (style == 3):
-							tmp_point = point2
-							point2 = point1
-							point1 = point2
-						if (rr):
-							r = float(rr.group(1))
-							c1,c2 = calc_center(point1,point2,r,plane)
-							center = c1
-							if (r < 0):
-								center = c2
-						patterns.append(ARC(style,l,s,plane,point1,point2,center))
-						
-				elif (style == 17): # XY plane
-						plane = 0
-						
-				elif (style == 18): # XZ plane
-						plane = 1
-						
-				elif (style == 19): # YZ plane
-						plane = 2
-				
-				pre_x = x
-				pre_y = y
-				pre_z = z					
-				l += 1
-				
-			gPATTERNS.append( PATTERN(gcodes.colour, patterns) )
-			f.close()
-
-def calc_center(p1,p2,r,plane):
-	"""
-	Calculate the center of two points.
-	
-	@parameters:
-	point1
-	point2
-	rotation angle
-	plane:
-	0 - XY
-	1 - ZX
-	2 - YZ
+	@return:
+	(rotation angle (radians), X shift, Y shift, unit)
 	
 	"""
-	r = copysign(r, r*r)
-	if (plane == 0):	#XY
-		if (p1.x == p2.x):
-			dx = (p2.x - p1.x)/2
-			dy = sqrt(r*r-dx*dx)
-			c1 = POINT(p1.x+dx,p1.y+dy,p1.z)
-			c2 = POINT(p1.x+dx,p1.y-dy,p1.z)
-		elif (p1.y == p2.y):
-			dy = (p2.y - p1.y)/2
-			dx = sqrt(r*r-dy*dy)
-			c1 = POINT(p1.x+dx,p1.y+dy,p1.z)
-			c2 = POINT(p1.x-dx,p1.y+dy,p1.z)
-		else:
-			a = (p2.y - p1.y)/(p2.x - p1.x)
-			av = -1/a
-			bv = (p2.y -+ p1.y)/2 - av * (p2.x + p1.x)/2
-			dx = sqrt(r*r/(av*av+1))
-			dy = av * dx
-			cx = (p2.x + p1.x)/2
-			cy = (p2.y + p1.y)/2
-			c1 = POINT(p1.x+dx,p1.y-dy,p1.z)
-			c2 = POINT(p1.x-dx,p1.y+dy,p1.z)
-#	if (plane == 1):	#ZX
-#	if (plane == 2):	#YZ
-	return [c1,c2]
+	return (gRotation_Angle * pi/180, gSHIFT_X, gSHIFT_Y, gUNIT)
 
 def rot_coor(p, c, theta):
 	"""
@@ -960,7 +1959,7 @@ def rot_coor(p, c, theta):
 	ang = atan2(dy,dx) + theta
 	r = sqrt(dx*dx+dy*dy)
 	
-def change_view(p1, p2, c=POINT(0.0, 0.0, 0.0) ):
+def change_view(p1, p2, c=POINT(0.0, 0.0, 0.0), angles=None ):
 	"""
 	3D to 2D projection.
 	
@@ -968,64 +1967,15 @@ def change_view(p1, p2, c=POINT(0.0, 0.0, 0.0) ):
 	point 1
 	point 2
 	center of rotation
+	rotation angles (theta, phi, psi), default _XYZ_ANGLES
 	
 	"""
-	# for now, fixed angles, in the future these could be input parameters
-	theta = pi/4.0
-	phi = pi/4.0
-	psi = 0.0
-	pp1 = POINT(0.0,0.0,0.0)
-	pp2 = POINT(0.0,0.0,0.0)
-	
-	# rotation around z
-	dx1 = p1.x-c.x
-	dy1 = p1.y-c.y
-	r1 = sqrt(dx1*dx1+dy1*dy1)
-	ang1 = atan2(dy1,dx1) + theta
-	
-	dx2 = p2.x-c.x
-	dy2 = p2.y-c.y
-	r2 = sqrt(dx2*dx2+dy2*dy2)
-	ang2 = atan2(dy2,dx2) + theta	
-
-	pp1.x = c.x+r1*cos(ang1)
-	pp1.y = c.y+r1*sin(ang1)
-	pp2.x = c.x+r2*cos(ang2)
-	pp2.y = c.y+r2*sin(ang2)
-
-	# rotation around x
-	dy1 = pp1.y-c.y
-	dz1 = pp1.z-c.z
-	r1 = sqrt(dz1*dz1+dy1*dy1)
-	ang1 = atan2(dy1,dz1) + phi
-	
-	dz2 = pp2.z-c.z
-	dy2 = pp2.y-c.y
-	r2 = sqrt(dz2*dz2+dy2*dy2)
-	ang2 = atan2(dy2,dz2) + phi	
-
-	pp1.z = c.z+r1*cos(ang1)
-	pp1.y = c.y+r1*sin(ang1)+p1.z
-	pp2.z = c.z+r2*cos(ang2)
-	pp2.y = c.y+r2*sin(ang2)+p2.z
-
-	# rotation around y
-	dx1 = pp1.x-c.x
-	dz1 = pp1.z-c.z
-	r1 = sqrt(dz1*dz1+dx1*dx1)
-	ang1 = atan2(dx1,dz1) + psi
-
-	dz2 = pp2.z-c.z
-	dx2 = pp2.x-c.x
-	r2 = sqrt(dz2*dz2+dx2*dx2)
-	ang2 = atan2(dx2,dz2) + psi
-
-	pp1.z = c.z+r1*cos(ang1)
-	pp1.x = c.y+r1*sin(ang1)
-	pp2.z = c.z+r2*cos(ang2)
-	pp2.x = c.y+r2*sin(ang2)
-
-	return pp1,pp2
+	m = view_matrix(*(angles or _XYZ_ANGLES))
+	pp = []
+	for p in (p1, p2):
+		q = np.dot(m, (p.x-c.x, p.y-c.y, p.z-c.z)).tolist()
+		pp.append(POINT(c.x+q[0], c.y+q[1], c.z+q[2]))
+	return pp[0],pp[1]
 
 def circle_points(cx,cy,r,points_num):
 	"""
@@ -1038,21 +1988,11 @@ def circle_points(cx,cy,r,points_num):
 	number of points
 	
 	"""
-	points=[]
 	if (points_num <= 2):
 		print "Too small angle at Circle"
 		return
-	i = points_num
-	while i > 0:
-		cir_x=cx+r*cos(2.0*pi*float(i)/float(points_num))
-		cir_x=cx+r*cos(2.0*pi*float(i)/float(points_num))
-		cir_y=cy+r*sin(2.0*pi*float(i)/float(points_num))
-		points.extend([cir_x,cir_y])
-		i -= 1
-	cir_x=cx+r*cos(0.0)
-	cir_y=cy+r*sin(0.0)
-	points.extend([cir_x,cir_y])
-	return points
+	ang = 2.0*pi*np.arange(points_num, -1, -1)/float(points_num)
+	return np.column_stack((cx + r*np.cos(ang), cy + r*np.sin(ang))).ravel().tolist()
 
 def arc_points(cx,cy,r,s_angle,e_angle,kaku):
 	"""
@@ -1070,42 +2010,13 @@ def arc_points(cx,cy,r,s_angle,e_angle,kaku):
 	Kaku's name most likely comes from the Japanese word "kaku" (角 kaku?, literally meaning "angle"), a reference to his rectangular nose
 
 	"""
-	points=[]
 	if (s_angle == e_angle):
 		print "Start and End angle are same"
 	int(kaku)
 	if (kaku <= 2):
 		print "Too small angle"
-	ang_step=(e_angle-s_angle)/(kaku-1)
-	i = 0
-	while i < kaku:
-		arc_x = cx + r*cos(s_angle+ang_step*float(i))
-		arc_y = cy + r*sin(s_angle+ang_step*float(i))
-		points.extend([arc_x,arc_y])
-		i += 1
-
-	return points
-
-def rot_point(point, center, angle):
-	dx = center.x - point.x
-	dy = point.y - center.y
-	initial_angle = atan2(dy,dx)
-	r = sqrt(dx*dx + dy*dy)
-	ch_angle = initial_angle + angle
-	point.x = center.x - r * cos(ch_angle)
-	point.y = center.y + r * sin(ch_angle)
-	return point
-
-def shift_point(point, xshift, yshift):
-	point.x = point.x + xshift
-	point.y = point.y + yshift
-	return point
-
-def scale_up(point, mag):
-	point.x = point.x * mag
-	point.y = point.y * mag
-	return point
-
+	ang = s_angle + (e_angle-s_angle)/(kaku-1)*np.arange(kaku)
+	return np.column_stack((cx + r*np.cos(ang), cy + r*np.sin(ang))).ravel().tolist()
 
 def error_dialog(error_mgs,sw):
 	"""